@@ -15,10 +15,10 @@ from __future__ import annotations
 
 import argparse
 import os
+from math import prod
 from typing import Any
 
 import h5py
-import numpy as np
 
 
 def _short_repr(val: Any, max_len: int = 80) -> str:
@@ -73,7 +73,7 @@ def main() -> None:
                 print(f"[GROUP]   /{name}")
             elif isinstance(obj, h5py.Dataset):
                 # Approx size in MiB
-                n_elem = int(np.prod(obj.shape)) if obj.shape else 1
+                n_elem = prod(obj.shape) if obj.shape else 1
                 bytes_total = n_elem * obj.dtype.itemsize
                 mib = bytes_total / (1024.0 * 1024.0)
                 print(
@@ -38,6 +38,8 @@ from typing import Optional
 import h5py
 import numpy as np
 
+# Approximate size of one tile when copying a (time, freq) slice.
+COPY_TILE_BYTES = 16 << 20
 
 # ---------------------------------------------------------------------
 # Helpers
@@ -48,6 +50,37 @@ def _copy_attrs(src, dst) -> None:
         dst.attrs[k] = v
 
 
+def _copy_slice(
+    g_out: h5py.Group,
+    name: str,
+    ds: h5py.Dataset,
+    time_slice: slice,
+    freq_slice: slice,
+    **kwargs,
+) -> h5py.Dataset:
+    """
+    Create g_out[name] for ds[time_slice, freq_slice] (chunking chosen by
+    h5py, as for data=...) and fill it in tiles of whole chunk rows of
+    about COPY_TILE_BYTES, so the full slice is never held in memory.
+    kwargs are passed on to create_dataset (compression etc.).
+    """
+    T = time_slice.stop - time_slice.start
+    F = freq_slice.stop - freq_slice.start
+    out = g_out.create_dataset(name, shape=(T, F), dtype=ds.dtype, chunks=True, **kwargs)
+
+    ct = out.chunks[0]
+    rows = ct * max(1, COPY_TILE_BYTES // (ct * F * ds.dtype.itemsize))
+    buf = np.empty((min(rows, T), F), dtype=ds.dtype)
+    for r0 in range(0, T, rows):
+        n = min(rows, T - r0)
+        t0 = time_slice.start + r0
+        ds.read_direct(buf, np.s_[t0:t0 + n, freq_slice], np.s_[:n])
+        out.write_direct(buf, np.s_[:n], np.s_[r0:r0 + n])
+
+    _copy_attrs(ds, out)
+    return out
+
+
 def _infer_output_path(in_path: str) -> str:
     """
     Default output path: <base>_demo.h5 in same directory
@@ -73,12 +106,24 @@ def make_demo_segment(
     n_frames: int = 256,
     start_idx_freq: int = 0,
     n_channels: int = 256,
+    compression: Optional[str] = "lzf",
+    fletcher32: bool = False,
 ) -> str:
     """
     Create a trimmed OVRO–LWA HDF5 demo file.
 
+    All datasets are written with the given compression ('lzf', 'gzip'
+    or None; shuffled when compressed) and, if fletcher32, per-chunk
+    checksums. The defaults favour speed: LZF writes and reads much
+    faster than gzip, and a derived demo file does not need checksums.
+
     Returns the output path.
     """
+    filters = dict(
+        compression=compression,
+        shuffle=compression is not None,
+        fletcher32=fletcher32,
+    )
     # Resolve input path: allow bare basename (no extension)
     if not os.path.exists(in_path):
         candidates = [f"{in_path}.h5", f"{in_path}.hdf5"]
@@ -182,55 +227,53 @@ def make_demo_segment(
 
             # --- Write sliced XX, YY ---
             print("[INFO] Writing XX/YY slices...")
-            g_tun_out.create_dataset(
+            _copy_slice(
+                g_tun_out,
                 "XX",
-                data=ds_xx[time_slice, freq_slice],
-                compression="gzip",
-                shuffle=True,
-                fletcher32=True,
+                ds_xx,
+                time_slice,
+                freq_slice,
+                **filters,
             )
-            _copy_attrs(ds_xx, g_tun_out["XX"])
 
-            g_tun_out.create_dataset(
+            _copy_slice(
+                g_tun_out,
                 "YY",
-                data=ds_yy[time_slice, freq_slice],
-                compression="gzip",
-                shuffle=True,
-                fletcher32=True,
+                ds_yy,
+                time_slice,
+                freq_slice,
+                **filters,
             )
-            _copy_attrs(ds_yy, g_tun_out["YY"])
 
             # --- Optional XY_real / XY_imag ---
             if ds_xy_real is not None:
                 print("[INFO] Writing XY_real slice...")
-                g_tun_out.create_dataset(
+                _copy_slice(
+                    g_tun_out,
                     "XY_real",
-                    data=ds_xy_real[time_slice, freq_slice],
-                    compression="gzip",
-                    shuffle=True,
-                    fletcher32=True,
+                    ds_xy_real,
+                    time_slice,
+                    freq_slice,
+                    **filters,
                 )
-                _copy_attrs(ds_xy_real, g_tun_out["XY_real"])
 
             if ds_xy_imag is not None:
                 print("[INFO] Writing XY_imag slice...")
-                g_tun_out.create_dataset(
+                _copy_slice(
+                    g_tun_out,
                     "XY_imag",
-                    data=ds_xy_imag[time_slice, freq_slice],
-                    compression="gzip",
-                    shuffle=True,
-                    fletcher32=True,
+                    ds_xy_imag,
+                    time_slice,
+                    freq_slice,
+                    **filters,
                 )
-                _copy_attrs(ds_xy_imag, g_tun_out["XY_imag"])
 
             # --- Freq subset ---
             print("[INFO] Writing freq slice...")
             g_tun_out.create_dataset(
                 "freq",
                 data=ds_freq[freq_slice],
-                compression="gzip",
-                shuffle=True,
-                fletcher32=True,
+                **filters,
             )
             _copy_attrs(ds_freq, g_tun_out["freq"])
 
@@ -239,9 +282,7 @@ def make_demo_segment(
             g_obs_out.create_dataset(
                 "time",
                 data=ds_time[time_slice],
-                compression="gzip",
-                shuffle=True,
-                fletcher32=True,
+                **filters,
             )
             _copy_attrs(ds_time, g_obs_out["time"])
 
@@ -312,6 +353,18 @@ def main() -> None:
         help="Number of frequency channels to keep (default: 256).",
     )
 
+    ap.add_argument(
+        "--compression",
+        choices=["lzf", "gzip", "none"],
+        default="lzf",
+        help="HDF5 compression for all output datasets (default: lzf).",
+    )
+    ap.add_argument(
+        "--checksum",
+        action="store_true",
+        help="Also store Fletcher32 checksums per chunk (off by default).",
+    )
+
     args = ap.parse_args()
 
     # Use aliases if provided
@@ -325,6 +378,8 @@ def main() -> None:
         n_frames=args.n_frames,
         start_idx_freq=start_idx_freq,
         n_channels=args.n_channels,
+        compression=None if args.compression == "none" else args.compression,
+        fletcher32=args.checksum,
     )
 
 
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+ovro_lwa_batch_common.py — helpers shared by the OVRO-LWA batch drivers.
+
+Stage-output caching
+--------------------
+Each product written by a batch driver gets a small sidecar file
+"<product>.fp" holding a fingerprint of everything that determines it:
+
+    - size and mtime (ns) of the stage input file,
+    - the stage parameters (as sorted JSON),
+    - the SHA-1 of the stage script that produced it.
+
+On a rerun, a stage is skipped when its product exists and the sidecar
+matches the current fingerprint, so iterating on e.g. --F-block or
+--flag-mode only redoes the stages that actually depend on them.
+Pass --force to the batch drivers to ignore the cache.
+
+Products written before the sidecars existed (or by running a stage
+script by hand) have no sidecar. For those, newer_than_source() accepts
+the product if it is newer than its input and, for HDF5 products, its
+file attributes record the same parameters. This relies on the stage
+scripts writing each product under a temporary name and renaming it into
+place only once complete: an interrupted or failed run leaves either no
+product or the previous one, never a partial file that looks finished.
+
+Input discovery
+---------------
+scan_dir() lists the files of --indir matching --pattern with a single
+os.scandir() pass (no per-entry stat/abspath), optionally keeping only
+the first --limit names without sorting the whole directory.
+readable_hdf5() then drops inputs that h5py cannot open (truncated or
+corrupt files), probing them concurrently, so they are reported up front
+instead of failing deep inside a stage.
+
+Chunked stage invocation
+------------------------
+The stage scripts accept several input files per call. run_batches()
+groups the pending inputs of a batch wrapper into chunks, so the
+Python/numpy/h5py import cost is paid once per chunk instead of once per
+file, and runs the chunks concurrently.
+
+Child output is streamed line by line through one TaggedLogger: reader
+threads push "[tag] line" records onto a queue and a single printer
+thread writes them out in batches, followed by one timestamped line per
+finished command.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fnmatch
+import functools
+import glob
+import hashlib
+import heapq
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+
+FP_SUFFIX = ".fp"
+
+
+@functools.lru_cache(maxsize=None)
+def _script_sha(script_path: str) -> str:
+    """SHA-1 of a stage script (read once per process)."""
+    with open(script_path, "rb") as fh:
+        return hashlib.sha1(fh.read()).hexdigest()
+
+
+def fingerprint(src_path: str, params: Dict[str, Any], script_path: str) -> str:
+    """
+    Fingerprint of one stage run: input file identity (size, mtime_ns),
+    stage parameters and stage-script version.
+    """
+    st = os.stat(src_path)
+    h = hashlib.blake2b(digest_size=12)
+    h.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    h.update(_script_sha(os.path.abspath(script_path)).encode())
+    return h.hexdigest()
+
+
+def read_fingerprint(out_path: str) -> Optional[str]:
+    """Return the fingerprint stored next to out_path, or None."""
+    try:
+        with open(out_path + FP_SUFFIX, "r") as fh:
+            return fh.read().strip()
+    except OSError:
+        return None
+
+
+def is_up_to_date(out_path: str, fp: str) -> bool:
+    """True if out_path exists and was produced with fingerprint fp."""
+    return os.path.exists(out_path) and read_fingerprint(out_path) == fp
+
+
+def write_fingerprint(out_path: str, fp: str) -> None:
+    """Record fp for out_path (atomically, so a crash never leaves a torn sidecar)."""
+    tmp = f"{out_path}{FP_SUFFIX}.tmp{os.getpid()}"
+    with open(tmp, "w") as fh:
+        fh.write(fp + "\n")
+    os.replace(tmp, out_path + FP_SUFFIX)
+
+
+@contextlib.contextmanager
+def atomic_output(path: str) -> Iterator[str]:
+    """
+    Yield a temporary name next to path for a stage to write its product
+    to. It is renamed onto path when the block exits normally and removed
+    on any error or interrupt, so a failed run never leaves a partial
+    product under the final name (which newer_than_source() would take
+    for a finished one), and an existing product stays intact.
+    """
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        yield tmp
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+
+
+def newer_than_source(
+    out_path: str,
+    src_path: str,
+    attrs: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """
+    Sidecar-less fallback: True if out_path is newer than src_path and,
+    when attrs is given, out_path is an HDF5 file whose root attributes
+    equal attrs. An attrs value of None means the attribute must be absent.
+    """
+    try:
+        if os.path.getmtime(out_path) <= os.path.getmtime(src_path):
+            return False
+    except OSError:
+        return False
+    if not attrs:
+        return True
+
+    import h5py
+
+    try:
+        with h5py.File(out_path, "r") as f:
+            stored = dict(f.attrs)
+    except OSError:
+        return False
+    for key, want in attrs.items():
+        if want is None:
+            if key in stored:
+                return False
+        elif key not in stored or stored[key] != want:
+            return False
+    return True
+
+
+# ----------------------------------------------------------------------
+# Input discovery
+# ----------------------------------------------------------------------
+def scan_dir(indir: str, pattern: str, limit: Optional[int] = None) -> List[str]:
+    """
+    Sorted absolute paths of the entries of indir matching pattern, i.e.
+    what sorted(glob(indir/pattern)) returns, from one os.scandir() pass.
+
+    With limit, only the first `limit` paths are returned and a heap is
+    used instead of sorting every entry. Patterns spanning directories
+    (containing a path separator) fall back to glob.
+    """
+    root = os.path.abspath(indir)
+
+    if os.sep in pattern or (os.altsep and os.altsep in pattern):
+        found = sorted(glob.glob(os.path.join(root, pattern)))
+        return found if limit is None else found[:limit]
+
+    # Like glob, hidden entries only match a pattern that starts with '.'.
+    match = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+    want_hidden = pattern.startswith(".")
+    try:
+        with os.scandir(root) as it:
+            names = (
+                e.name for e in it
+                if (want_hidden or not e.name.startswith("."))
+                and match(os.path.normcase(e.name))
+            )
+            if limit is None:
+                selected = sorted(names)
+            else:
+                selected = heapq.nsmallest(limit, names)
+    except OSError:
+        return []
+
+    return [os.path.join(root, name) for name in selected]
+
+
+def _probe_hdf5(path: str) -> bool:
+    """True if path opens as an HDF5 file with at least one member."""
+    import h5py
+
+    try:
+        with h5py.File(path, "r") as f:
+            return len(f) > 0
+    except OSError:
+        return False
+
+
+def readable_hdf5(paths: Sequence[str], max_workers: int = 16) -> List[str]:
+    """
+    The paths that open as non-empty HDF5 files, in their original order;
+    the others are reported with a [SKIP] line. The probes only read the
+    file headers and mostly wait on I/O, so they run on a thread pool.
+    """
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as ex:
+        ok = list(ex.map(_probe_hdf5, paths))
+    for path, good in zip(paths, ok):
+        if not good:
+            print(f"[SKIP] Not a readable HDF5 file: {path}")
+    return [path for path, good in zip(paths, ok) if good]
+
+
+# ----------------------------------------------------------------------
+# Chunked stage invocation
+# ----------------------------------------------------------------------
+# Printed by the stage scripts after each input they finished successfully.
+DONE_MARKER = "[INFO] Done: "
+
+
+def run_each_input(paths: Sequence[str], fn: Callable[[str], Any]) -> None:
+    """
+    Per-file loop of the stage scripts' CLIs: call fn(path) for each input.
+
+    A single input fails as usual (with its traceback). With several, a
+    failing input is reported and the others still run; the script then
+    exits with status 1. DONE_MARKER and the path are printed after each
+    input that succeeded, which is what run_batches() trusts when a call
+    fails or dies.
+    """
+    failed = []
+    for path in paths:
+        try:
+            fn(path)
+        except Exception as exc:
+            if len(paths) == 1:
+                raise
+            print(f"[ERROR] Failed: {path}")
+            print(f"[ERROR]   {exc!r}")
+            failed.append(path)
+        else:
+            print(f"{DONE_MARKER}{path}")
+
+    if failed:
+        raise SystemExit(1)
+
+
+class TaggedLogger:
+    """
+    Single printer for the output of concurrently running children.
+
+    log() only enqueues; one printer thread drains whatever is pending and
+    writes it with a single write()/flush(), so lines never tear and the
+    terminal is not flushed once per line. Use as a context manager (or
+    call close()) to flush everything before returning.
+    """
+
+    def __init__(self, stream: Optional[IO[str]] = None) -> None:
+        self._stream = stream if stream is not None else sys.stdout
+        self._q: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def log(self, tag: Optional[str], line: str) -> None:
+        """Queue one line, prefixed with [tag] if tag is given."""
+        self._q.put(f"[{tag}] {line}" if tag else line)
+
+    def _drain(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            while True:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+            done = None in batch
+            lines = [b for b in batch if b is not None]
+            if lines:
+                self._stream.write("\n".join(lines) + "\n")
+                self._stream.flush()
+            if done:
+                return
+
+    def close(self) -> None:
+        self._q.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> "TaggedLogger":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def call(cmd: List[str], tag: str, logger: TaggedLogger) -> Tuple[int, str]:
+    """
+    Run one command, streaming its combined stdout/stderr to logger under
+    [tag] as it is produced, then log one timestamped completion line.
+    Returns (returncode, captured output).
+    """
+    t0 = time.monotonic()
+    captured: List[str] = []
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        # Children write to a pipe; keep them line-buffered so lines arrive live.
+        env={**os.environ, "PYTHONUNBUFFERED": "1"},
+    ) as proc:
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            line = line.rstrip("\n")
+            captured.append(line)
+            logger.log(tag, line)
+        ret = proc.wait()
+
+    status = "[INFO] Finished" if ret == 0 else "[ERROR] Failed"
+    logger.log(
+        tag,
+        f"[{time.strftime('%H:%M:%S')}] {status} {os.path.basename(cmd[1])} "
+        f"(exit code {ret}, {time.monotonic() - t0:.1f} s)",
+    )
+    return ret, "\n".join(captured)
+
+
+def _done_inputs(output: str) -> Set[str]:
+    """Inputs reported as finished by a stage call."""
+    done = set()
+    for line in output.splitlines():
+        _, sep, path = line.partition(DONE_MARKER)
+        if sep:
+            done.add(path.strip())
+    return done
+
+
+def run_batches(
+    pending: Sequence[Tuple[str, str, str]],
+    make_cmd: Callable[[List[str]], List[str]],
+    *,
+    jobs: Optional[int],
+    chunk_size: int,
+    dry_run: bool,
+    script_name: str,
+) -> int:
+    """
+    Run a stage script over pending (input, output, fingerprint) items,
+    chunk_size inputs per interpreter, up to `jobs` chunks at a time.
+
+    make_cmd(inputs) must return the full command line for one chunk.
+    The fingerprint of every output that was (re)written successfully is
+    recorded: all of them when the call exits with 0, otherwise only those
+    whose input the stage script reported as done. Returns the number of
+    failed inputs.
+    """
+    if not pending:
+        return 0
+
+    jobs = jobs if jobs is not None else min(os.cpu_count() or 1, len(pending))
+    jobs = max(1, jobs)
+    # Never make chunks so large that the worker pool sits idle.
+    size = max(1, min(chunk_size, -(-len(pending) // jobs)))
+    chunks = [list(pending[i:i + size]) for i in range(0, len(pending), size)]
+    cmds = [make_cmd([path for path, _out, _fp in chunk]) for chunk in chunks]
+
+    print("=" * 60)
+    print(f"[INFO] {len(pending)} file(s) in {len(chunks)} chunk(s), {jobs} parallel job(s).")
+    for cmd in cmds:
+        print("[INFO] Command:", " ".join(cmd))
+    if dry_run:
+        print("[DRY-RUN] Not executing.")
+        return 0
+
+    tags = [
+        os.path.basename(chunk[0][0]) + (f" +{len(chunk) - 1}" if len(chunk) > 1 else "")
+        for chunk in chunks
+    ]
+
+    n_failed = 0
+    with TaggedLogger() as logger, ThreadPoolExecutor(max_workers=min(jobs, len(chunks))) as ex:
+        results = ex.map(lambda c, t: call(c, t, logger), cmds, tags)
+        for chunk, (ret, out) in zip(chunks, results):
+            # A child that dies without reporting (killed, out of memory,
+            # interrupted) may have left any of its outputs unfinished, so on
+            # a non-zero exit only the inputs it reported as done count.
+            done = _done_inputs(out) if ret != 0 else None
+            for path, out_path, fp in chunk:
+                if done is None or path in done:
+                    write_fingerprint(out_path, fp)
+                else:
+                    n_failed += 1
+                    logger.log(None, f"[ERROR] {script_name} failed for {path} (exit code {ret})")
+    return n_failed
@@ -8,41 +8,95 @@ For each input *raw* OVRO-LWA HDF5 file:
 
   1) Run SK streaming (dual-pol) with ovro_lwa_sk_stream.py
      → produces <results_out>/<base>_skstream.h5
+       (or a /dev/shm scratch copy with --tmpfs-intermediate)
 
-  2) Run quicklook on the SK-stream product (Stage 1)
-     → produces <png_out>/<base>_skstream_*.png
-
-  3) Run RFI cleaning with ovro_lwa_rfi_clean.py
+  2) Run RFI cleaning with ovro_lwa_rfi_clean.py
      → produces <results_out>/<base>_skstream_rfi_M<M>_F<F_block>_<flag_mode>.h5
 
-  4) Run quicklook on the RFI-clean product
-     → produces <png_out>/<base>_skstream_rfi_M<M>_F<F_block>_<flag_mode>_*.png
+  3) Run quicklook on the SK-stream and RFI-clean products in one call
+     (sk_quicklook.render_pair, shared S1 colour scale unless --vmin/--vmax)
+     → produces <png_out>/<base>_skstream_*.png
+        and <png_out>/<base>_skstream_rfi_M<M>_F<F_block>_<flag_mode>_*.png
 
 This script is designed to orchestrate the three building blocks you
 already have (stream, clean, quicklook), and to ensure that BOTH
 Stage-1 (SK stream) and Stage-2 (RFI clean) PNG plots are produced.
+The stages are imported and called in-process (sk_stream.run,
+rfi_clean.run, sk_quicklook.render_pair), so numpy/h5py/matplotlib/pygsk are
+imported once per worker instead of once per stage per file, and the
+PNGs are drawn on bare Agg figures without going through pyplot.
+
+Stages whose output already exists and was produced from the same input
+and parameters (see ovro_lwa_batch_common) are skipped; use --force to
+re-run everything. Outputs without a fingerprint sidecar are reused when
+they are newer than their input and, for the HDF5 products, their
+attributes record the same stage parameters (PNGs: mtime only).
+With --tmpfs-intermediate the SK-stream product is not kept, so the
+RFI-clean and PNG fingerprints are chained from the raw file and the
+stream parameters instead, and stage 1 is skipped for a file whose
+RFI-clean product and PNGs are all up to date.
+
+Each raw file produces its own set of outputs, so files are independent.
+The stages are pipelined across files and executed by a pool of --jobs
+worker processes: streaming (HDF5 reads) of the next file overlaps with
+cleaning and plotting of the previous ones. With a fixed S1 colour scale
+(--vmin and --vmax) the SK-stream quicklook no longer depends on the
+RFI-clean product and is drawn concurrently with RFI cleaning.
+
+A failing stage is retried (--retries) and the file is then skipped, so
+one bad file does not abort the batch; the failed files are listed in
+<results_out>/failed.txt. Use --stop-on-error to stop at the first one.
 """
 
 from __future__ import annotations
 
 import argparse
-import glob
+import atexit
+import contextlib
+import functools
+import io
+import multiprocessing
 import os
-import sys
+import queue
+import shlex
+import shutil
 import subprocess
-from typing import List, Optional
+import sys
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Workers never open a window; select a non-interactive backend before
+# the stage modules pull in pyplot.
+import matplotlib
+matplotlib.use("Agg")
+
+import h5py
+
+import ovro_lwa_batch_common as batch_common
+import ovro_lwa_rfi_clean as rfi_clean
+import ovro_lwa_sk_quicklook as sk_quicklook
+import ovro_lwa_sk_stream as sk_stream
 
 
 # ----------------------------------------------------------------------
 # Helpers
 # ----------------------------------------------------------------------
-def _find_inputs(files: List[str], indir: Optional[str], pattern: str) -> List[str]:
+def _find_inputs(
+    files: List[str],
+    indir: Optional[str],
+    pattern: str,
+    limit: Optional[int] = None,
+) -> List[str]:
     """
     Build the list of raw HDF5 inputs.
 
     Priority:
       1) Explicit positional files, if any (they must exist).
-      2) Otherwise, glob(indir/pattern).
+      2) Otherwise, the sorted matches of indir/pattern (first `limit` only).
+
+    Files that do not open as HDF5 are skipped.
     """
     inputs: List[str] = []
 
@@ -55,9 +109,10 @@ def _find_inputs(files: List[str], indir: Optional[str], pattern: str) -> List[s
 
     # 2) If none provided, use indir + pattern
     if not inputs and indir:
-        pattern_path = os.path.join(indir, pattern)
-        globbed = sorted(glob.glob(pattern_path))
-        inputs.extend(os.path.abspath(p) for p in globbed)
+        inputs.extend(batch_common.scan_dir(indir, pattern, limit))
+
+    # Drop truncated/corrupt files before they reach the stream stage.
+    inputs = batch_common.readable_hdf5(inputs)
 
     if not inputs:
         raise SystemExit(
@@ -68,10 +123,24 @@ def _find_inputs(files: List[str], indir: Optional[str], pattern: str) -> List[s
     return inputs
 
 
-def _run(cmd: List[str]) -> None:
-    """Run a subprocess command with basic logging."""
-    print(f"[CMD] {' '.join(cmd)}")
-    subprocess.run(cmd, check=True)
+def _emit(buf: io.StringIO, tag: str) -> None:
+    """
+    Re-emit captured stage output with a [tag] prefix, so logs from files
+    processed concurrently remain readable. (In the pool this goes to the
+    task's own capture, see _run_captured.)
+    """
+    for line in buf.getvalue().splitlines():
+        print(f"[{tag}] {line}")
+
+
+def _call_stage(tag: str, fn: Callable[..., Any], *fargs: Any, **fkwargs: Any) -> Any:
+    """Call a stage run() with its stdout/stderr captured and re-emitted under [tag]."""
+    buf = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+            return fn(*fargs, **fkwargs)
+    finally:
+        _emit(buf, tag)
 
 
 def _base_from_raw(path: str) -> str:
@@ -81,14 +150,695 @@ def _base_from_raw(path: str) -> str:
     return root
 
 
+def _stage_options(args: argparse.Namespace, png_out: str, intermediate_dir: str) -> Dict[str, Any]:
+    """
+    Everything the stage workers need, derived from the CLI once per run
+    instead of once per file and stage. The per-stage dicts are passed
+    as-is as keyword arguments and hashed into the cache fingerprints.
+    """
+    return dict(
+        stream=dict(
+            M=args.M,
+            N=args.N,
+            d=args.d,
+            pfa=args.pfa,
+            start_idx=args.start_idx,
+            ns_max=args.ns_max,
+        ),
+        clean=dict(F_block=args.F_block, flag_mode=args.flag_mode),
+        # sk_quicklook.render_pair() / render() keyword arguments
+        quicklook=dict(
+            pol=args.pol,
+            scale=args.scale,
+            vmin=args.vmin,
+            vmax=args.vmax,
+            log_eps=args.log_eps,
+            out_dir=png_out,
+            dpi=args.dpi,
+            transparent=args.transparent,
+        ),
+        # Dry-run RFI product name: <base>_skstream_rfi_M<M>_F<F_block>_<flag_mode>.h5
+        rfi_suffix=f"_skstream_rfi_M{args.M}_F{args.F_block}_{args.flag_mode}.h5",
+        # With a fixed S1 scale the two quicklooks are independent, so the
+        # SK-stream one can be drawn while RFI cleaning runs.
+        fixed_scale=args.vmin is not None and args.vmax is not None,
+        intermediate_dir=intermediate_dir,
+        # The SK-stream intermediate is not kept (--tmpfs-intermediate):
+        # downstream products are fingerprinted from the raw file instead.
+        chained=intermediate_dir != os.path.abspath(args.results_out),
+        dry_run=args.dry_run,
+        force=args.force,
+    )
+
+
+def _check_cache(
+    tag: str,
+    out_path: str,
+    src: str,
+    params: Dict[str, Any],
+    script: str,
+    force: bool,
+    attrs: Optional[Dict[str, Any]] = None,
+) -> Tuple[bool, Optional[str]]:
+    """
+    Return (skip, fp): skip is True when out_path is up to date with respect
+    to src/params/script. fp is None when src does not exist yet (dry run).
+
+    An output without a fingerprint sidecar is also accepted when it is
+    newer than src and its HDF5 attributes match attrs (if given); its
+    sidecar is then written so later runs use the fingerprint.
+    """
+    if not os.path.exists(src):
+        return False, None
+    fp = batch_common.fingerprint(src, params, script)
+    if force:
+        return False, fp
+    if batch_common.is_up_to_date(out_path, fp):
+        print(f"[{tag}] [SKIP] Up to date: {out_path}")
+        return True, fp
+    if batch_common.read_fingerprint(out_path) is None and batch_common.newer_than_source(
+        out_path, src, attrs
+    ):
+        print(f"[{tag}] [SKIP] Newer than input: {out_path}")
+        batch_common.write_fingerprint(out_path, fp)
+        return True, fp
+    return False, fp
+
+
+def _chained_params(raw_path: str, opts: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Cache parameters of the RFI-clean product ("clean") and of the PNGs
+    ("skstream_png", "rfi_png") when the SK-stream intermediate is not kept.
+
+    Every --tmpfs-intermediate run recreates the intermediate, so the
+    downstream fingerprints cannot depend on it. They are taken against
+    the raw file instead, each with the fingerprint of the product it is
+    made from as "upstream": the stream parameters and script are thus
+    part of the RFI-clean fingerprint, which is in turn part of the PNGs'.
+    """
+    stream_fp = batch_common.fingerprint(raw_path, opts["stream"], sk_stream.__file__)
+    clean = dict(opts["clean"], upstream=stream_fp)
+    clean_fp = batch_common.fingerprint(raw_path, clean, rfi_clean.__file__)
+    ql_kwargs = opts["quicklook"]
+    if opts["fixed_scale"]:
+        return dict(
+            clean=clean,
+            skstream_png=dict(ql_kwargs, upstream=stream_fp),
+            rfi_png=dict(ql_kwargs, upstream=clean_fp),
+        )
+    # Shared colour scale: both PNGs depend on both products.
+    pair = dict(ql_kwargs, upstream=clean_fp)
+    return dict(clean=clean, skstream_png=pair, rfi_png=pair)
+
+
+def _downstream_up_to_date(
+    raw_path: str,
+    skstream_out: str,
+    opts: Dict[str, Any],
+    results_out: str,
+    png_out: str,
+) -> bool:
+    """
+    True if the RFI-clean product and both PNGs of raw_path are up to date
+    (chained fingerprints only), so the SK-stream intermediate is not needed.
+    """
+    chained = _chained_params(raw_path, opts)
+    rfi_out = os.path.join(results_out, _base_from_raw(raw_path) + opts["rfi_suffix"])
+    pol = opts["quicklook"]["pol"]
+    checks = [
+        (rfi_out, chained["clean"], rfi_clean.__file__),
+        (
+            sk_quicklook.output_path(skstream_out, pol, "png", png_out, product="skstream"),
+            chained["skstream_png"],
+            sk_quicklook.__file__,
+        ),
+        (
+            sk_quicklook.output_path(rfi_out, pol, "png", png_out, product="rfi"),
+            chained["rfi_png"],
+            sk_quicklook.__file__,
+        ),
+    ]
+    return all(
+        batch_common.is_up_to_date(out, batch_common.fingerprint(raw_path, params, script))
+        for out, params, script in checks
+    )
+
+
+def _pair_params(ql_kwargs: Dict[str, Any], partner: str) -> Dict[str, Any]:
+    """
+    Cache parameters of one PNG of a quicklook pair: the shared colour scale
+    also depends on the other product, so its identity is included.
+    """
+    st = os.stat(partner)
+    return dict(ql_kwargs, shared_with=[st.st_size, st.st_mtime_ns])
+
+
+def _quicklook_pair(
+    tag: str,
+    raw_path: str,
+    skstream_src: str,
+    rfi_src: str,
+    opts: Dict[str, Any],
+    png_out: str,
+) -> None:
+    """Quicklooks of both products unless both PNGs are up to date."""
+    ql_kwargs = opts["quicklook"]
+    if not (os.path.exists(skstream_src) and os.path.exists(rfi_src)):
+        # Dry run, stage 1 skipped (everything downstream up to date), or
+        # the SK-stream product was removed: RFI quicklook only.
+        _quicklook(tag, raw_path, rfi_src, "rfi", opts, png_out)
+        return
+    chained = _chained_params(raw_path, opts) if opts["chained"] else None
+
+    todo = []
+    for src, partner, product in (
+        (skstream_src, rfi_src, "skstream"),
+        (rfi_src, skstream_src, "rfi"),
+    ):
+        png_path = sk_quicklook.output_path(src, ql_kwargs["pol"], "png", png_out, product=product)
+        if chained is not None:
+            cache_src, params = raw_path, chained[product + "_png"]
+        else:
+            cache_src, params = src, _pair_params(ql_kwargs, partner)
+        skip, fp = _check_cache(
+            tag, png_path, cache_src, params, sk_quicklook.__file__, opts["force"],
+        )
+        if not skip:
+            todo.append((png_path, fp))
+    if not todo or opts["dry_run"]:
+        return
+
+    # Re-render both: they share one colour scale.
+    _call_stage(tag, sk_quicklook.render_pair, skstream_src, rfi_src, **ql_kwargs)
+    for png_path, fp in todo:
+        batch_common.write_fingerprint(png_path, fp)
+
+
+def _quicklook(
+    tag: str,
+    raw_path: str,
+    src: str,
+    product: str,
+    opts: Dict[str, Any],
+    png_out: str,
+) -> None:
+    """Quicklook of src unless its PNG is up to date."""
+    ql_kwargs = opts["quicklook"]
+    png_path = sk_quicklook.output_path(src, ql_kwargs["pol"], "png", png_out, product=product)
+    cache_src, params = src, ql_kwargs
+    if opts["chained"]:
+        cache_src, params = raw_path, _chained_params(raw_path, opts)[product + "_png"]
+    skip, fp = _check_cache(tag, png_path, cache_src, params, sk_quicklook.__file__, opts["force"])
+    if skip or opts["dry_run"]:
+        return
+    _call_stage(tag, sk_quicklook.render, src, **ql_kwargs)
+    if fp is not None:
+        batch_common.write_fingerprint(png_path, fp)
+
+
+# ----------------------------------------------------------------------
+# Stage workers (executed in the process pool)
+#
+# Every stage has the signature fn(raw_path, src, *, opts, results_out,
+# png_out) -> product, where src is the product of the previous stage
+# (the raw file itself for the first stage). Each product is skipped when
+# its fingerprint sidecar shows it is up to date (see ovro_lwa_batch_common).
+# ----------------------------------------------------------------------
+def stage_stream(
+    raw_path: str,
+    src: str,
+    *,
+    opts: Dict[str, Any],
+    results_out: str,
+    png_out: str,
+) -> str:
+    """Stage 1: SK streaming → *_skstream.h5."""
+    base = _base_from_raw(raw_path)
+    print(f"[{base}] [INFO] Processing raw file: {raw_path}")
+
+    skstream_out = os.path.join(opts["intermediate_dir"], f"{base}_skstream.h5")
+    if opts["chained"] and not opts["force"] and _downstream_up_to_date(
+        raw_path, skstream_out, opts, results_out, png_out
+    ):
+        print(f"[{base}] [SKIP] RFI-clean product and quicklooks up to date; not streaming.")
+        return skstream_out
+
+    print(f"[{base}] [INFO] [Stage 1] Streaming to: {skstream_out}")
+
+    params = opts["stream"]
+    attrs = dict(
+        M=params["M"],
+        N=params["N"],
+        d=params["d"],
+        pfa=params["pfa"],
+        ns_start=params["start_idx"],
+        ns_max=params["ns_max"],
+    )
+    skip, fp = _check_cache(
+        base, skstream_out, src, params, sk_stream.__file__, opts["force"], attrs
+    )
+    if not (skip or opts["dry_run"]):
+        _call_stage(base, sk_stream.run, src, out=skstream_out, **params)
+        if fp is not None:
+            batch_common.write_fingerprint(skstream_out, fp)
+    return skstream_out
+
+
+def stage_clean(
+    raw_path: str,
+    src: str,
+    *,
+    opts: Dict[str, Any],
+    results_out: str,
+    png_out: str,
+) -> str:
+    """Stage 2: RFI cleaning of *_skstream.h5 → *_skstream_rfi_...h5."""
+    base = _base_from_raw(raw_path)
+
+    print(f"[{base}] [INFO] [Stage 2] RFI cleaning...")
+    params = opts["clean"]
+    if opts["chained"]:
+        # Cached against the raw file; the name follows rfi_clean's convention.
+        rfi_out = os.path.join(results_out, base + opts["rfi_suffix"])
+        skip, fp = _check_cache(
+            base, rfi_out, raw_path, _chained_params(raw_path, opts)["clean"],
+            rfi_clean.__file__, opts["force"], params,
+        )
+        if not (skip or opts["dry_run"]):
+            rfi_out = _call_stage(base, rfi_clean.run, src, out_dir=results_out, **params)
+            batch_common.write_fingerprint(rfi_out, fp)
+        print(f"[{base}] [INFO] [Stage 2] RFI-clean product: {rfi_out}")
+        return rfi_out
+
+    if not os.path.exists(src):
+        # Dry run: we know the naming convention from rfi_clean.
+        rfi_out = os.path.join(results_out, base + opts["rfi_suffix"])
+        print(f"[{base}] [INFO] [Stage 2] RFI-clean product: {rfi_out}")
+        return rfi_out
+
+    # One handle serves both the output-name lookup and the cleaning.
+    with h5py.File(src, "r") as sk_h5:
+        rfi_out = rfi_clean.output_path(sk_h5, results_out, **params)
+        skip, fp = _check_cache(
+            base, rfi_out, src, params, rfi_clean.__file__, opts["force"], params
+        )
+        if not (skip or opts["dry_run"]):
+            rfi_out = _call_stage(base, rfi_clean.run, sk_h5, out_dir=results_out, **params)
+            if fp is not None:
+                batch_common.write_fingerprint(rfi_out, fp)
+    print(f"[{base}] [INFO] [Stage 2] RFI-clean product: {rfi_out}")
+    return rfi_out
+
+
+def stage_skstream_quicklook(
+    raw_path: str,
+    src: str,
+    *,
+    opts: Dict[str, Any],
+    results_out: str,
+    png_out: str,
+) -> str:
+    """
+    Stage-1 quicklook on *_skstream.h5 alone. Only used with a fixed S1
+    colour scale (--vmin and --vmax), where it does not depend on the
+    RFI-clean product and runs alongside stage 2.
+    """
+    base = _base_from_raw(raw_path)
+
+    print(f"[{base}] [INFO] [Stage 2] Quicklook for SK-stream product...")
+    _quicklook(base, raw_path, src, "skstream", opts, png_out)
+    return src
+
+
+def stage_final(
+    raw_path: str,
+    src: str,
+    *,
+    opts: Dict[str, Any],
+    results_out: str,
+    png_out: str,
+) -> str:
+    """
+    Stage 3: quicklooks of the SK-stream and RFI-clean products (only the
+    RFI-clean one if the SK-stream quicklook ran alongside stage 2).
+    """
+    base = _base_from_raw(raw_path)
+    skstream_src = os.path.join(opts["intermediate_dir"], f"{base}_skstream.h5")
+
+    if opts["fixed_scale"]:
+        print(f"[{base}] [INFO] [Stage 3] Quicklook for RFI-clean product...")
+        _quicklook(base, raw_path, src, "rfi", opts, png_out)
+    else:
+        print(f"[{base}] [INFO] [Stage 3] Quicklooks for SK-stream and RFI-clean products...")
+        _quicklook_pair(base, raw_path, skstream_src, src, opts, png_out)
+
+    # The SK-stream product is not needed past this point; free tmpfs early.
+    if opts["intermediate_dir"] != results_out and not opts["dry_run"]:
+        for path in (skstream_src, skstream_src + batch_common.FP_SUFFIX):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+    return src
+
+
+# ----------------------------------------------------------------------
+# Intermediate products on tmpfs
+# ----------------------------------------------------------------------
+_SHM = "/dev/shm"
+
+
+def _tmpfs_intermediate_dir(inputs: List[str], M: int, jobs: int) -> Optional[str]:
+    """
+    Create a private directory under /dev/shm for the *_skstream.h5
+    intermediates (removed at exit), or return None if tmpfs is unavailable
+    or too small for the files that can be in flight at once.
+    """
+    if not sys.platform.startswith("linux") or not os.path.isdir(_SHM):
+        print(f"[WARN] --tmpfs-intermediate: {_SHM} not available; "
+              "keeping SK-stream products in --results-out.")
+        return None
+
+    # An SK-stream product holds float32 s1 + int8 flags per pol and block,
+    # i.e. ~1.25/M of the raw float32 XX+YY size; allow 2/M for overheads.
+    # Up to ~7*jobs files sit between stage 1 and the end of stage 3
+    # (jobs streaming, 2*jobs queued, jobs cleaning, 2*jobs queued,
+    # jobs plotting).
+    est = sorted((2 * os.path.getsize(p) // max(M, 1) for p in inputs), reverse=True)
+    need = sum(est[:7 * jobs])
+    free = shutil.disk_usage(_SHM).free
+    if free < need:
+        print(f"[WARN] --tmpfs-intermediate: {_SHM} has {free / 2**30:.2f} GiB free, "
+              f"~{need / 2**30:.2f} GiB needed; keeping SK-stream products in --results-out.")
+        return None
+
+    tmp_dir = os.path.join(_SHM, f"ovro_pipe_{uuid.uuid4().hex}")
+    os.mkdir(tmp_dir)
+    atexit.register(shutil.rmtree, tmp_dir, ignore_errors=True)
+    return tmp_dir
+
+
+# ----------------------------------------------------------------------
+# Makefile mode
+# ----------------------------------------------------------------------
+def _mk_target(path: str) -> str:
+    """Escape a path for use as a make target or prerequisite."""
+    return path.replace("$", "$$").replace(" ", "\\ ")
+
+
+def _mk_arg(arg: str) -> str:
+    """Quote one recipe argument for the shell, escaping make's '$'."""
+    return shlex.quote(arg).replace("$", "$$")
+
+
+def _mk_rule(target: str, prereq: str, cmd: List[str]) -> str:
+    return (
+        f"{_mk_target(target)}: {_mk_target(prereq)}\n"
+        f"\t{' '.join(_mk_arg(c) for c in cmd)}\n"
+    )
+
+
+def write_makefile(
+    path: str,
+    inputs: List[str],
+    opts: Dict[str, Any],
+    results_out: str,
+    png_out: str,
+) -> None:
+    """
+    Write a Makefile with one rule per product and file (raw → SK stream →
+    RFI clean, plus one rule per quicklook PNG) calling the stage scripts.
+
+    make then does the scheduling (-j), the mtime-based skipping and the
+    failure isolation (-k). Unlike the in-process pipeline it does not see
+    parameter changes that keep the file names (use --force, i.e. make -B),
+    and each quicklook is drawn on its own colour scale unless --vmin/--vmax
+    are given.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    stream, clean, ql = opts["stream"], opts["clean"], opts["quicklook"]
+
+    stream_opts = [
+        "--M", str(stream["M"]), "--N", str(stream["N"]),
+        "--d", str(stream["d"]), "--pfa", str(stream["pfa"]),
+        "--start-idx", str(stream["start_idx"]),
+    ]
+    if stream["ns_max"] is not None:
+        stream_opts += ["--ns-max", str(stream["ns_max"])]
+    clean_opts = ["--F-block", str(clean["F_block"]), "--flag-mode", clean["flag_mode"]]
+    ql_opts = [
+        "--pol", ql["pol"], "--scale", ql["scale"], "--dpi", str(ql["dpi"]),
+        "--save-plot", "png", "--out", png_out, "--no-show",
+    ]
+    for flag, key in (("--vmin", "vmin"), ("--vmax", "vmax"), ("--log-eps", "log_eps")):
+        if ql[key] is not None:
+            ql_opts += [flag, str(ql[key])]
+    if ql["transparent"]:
+        ql_opts.append("--transparent")
+
+    def script(name: str) -> List[str]:
+        return [sys.executable, os.path.join(here, name)]
+
+    rules: List[str] = []
+    pngs: List[str] = []
+    for raw_path in inputs:
+        base = _base_from_raw(raw_path)
+        sk = os.path.join(results_out, f"{base}_skstream.h5")
+        rfi = os.path.join(results_out, base + opts["rfi_suffix"])
+        png_sk = sk_quicklook.output_path(sk, ql["pol"], "png", png_out, product="skstream")
+        png_rfi = sk_quicklook.output_path(rfi, ql["pol"], "png", png_out, product="rfi")
+        pngs += [png_sk, png_rfi]
+        rules.append(_mk_rule(
+            sk, raw_path, script("ovro_lwa_sk_stream.py") + [raw_path, "--out", sk] + stream_opts
+        ))
+        rules.append(_mk_rule(
+            rfi, sk, script("ovro_lwa_rfi_clean.py") + [sk, "--out-dir", results_out] + clean_opts
+        ))
+        rules.append(_mk_rule(png_sk, sk, script("ovro_lwa_sk_quicklook.py") + [sk] + ql_opts))
+        rules.append(_mk_rule(png_rfi, rfi, script("ovro_lwa_sk_quicklook.py") + [rfi] + ql_opts))
+
+    with open(path, "w") as fh:
+        fh.write("# Generated by ovro_lwa_batch_pipeline.py --emit-makefile\n")
+        fh.write(".DELETE_ON_ERROR:\n.PHONY: all\n\n")
+        fh.write("all: " + " \\\n    ".join(_mk_target(p) for p in pngs) + "\n\n")
+        fh.write("\n".join(rules))
+
+
+def run_make(makefile: str, jobs: int, *, keep_going: bool, force: bool, dry_run: bool) -> int:
+    """Run make on makefile; return its exit code (127 if make is missing)."""
+    make = shutil.which("make")
+    if make is None:
+        print(f"[ERROR] 'make' not found on PATH; run the Makefile yourself: {makefile}")
+        return 127
+    cmd = [make, "-f", makefile, f"-j{jobs}"]
+    if keep_going:
+        cmd.append("-k")
+    if force:
+        cmd.append("-B")
+    if dry_run:
+        cmd.append("-n")
+    print("[INFO] Command:", " ".join(cmd))
+    return subprocess.call(cmd)
+
+
+# ----------------------------------------------------------------------
+# Stage scheduling
+# ----------------------------------------------------------------------
+def _mp_context() -> multiprocessing.context.BaseContext:
+    """
+    Start workers from a forkserver that has already imported this script
+    and the stage modules. Each worker is then forked from that small,
+    pre-warmed server rather than from the (larger, threaded) main
+    process, so the fork neither copies the parent's page tables nor
+    re-imports numpy/h5py/matplotlib/pygsk. Falls back to the platform
+    default where forkserver is unavailable.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload([
+        "__main__",
+        "ovro_lwa_batch_common",
+        "ovro_lwa_rfi_clean",
+        "ovro_lwa_sk_quicklook",
+        "ovro_lwa_sk_stream",
+    ])
+    return ctx
+
+
+_DONE = None  # queue sentinel
+
+
+def _run_captured(
+    fn: Callable[[str, str], str], raw_path: str, src: str
+) -> Tuple[Optional[str], str, Optional[Exception]]:
+    """
+    Pool task: run one stage function with its stdout and stderr captured
+    and return (product, log, exc), exc being the exception it raised, if
+    any.
+
+    Workers never print themselves: each has its own block-buffered
+    stdout, so lines of files processed concurrently would be torn and
+    merged. The parent prints log through one TaggedLogger instead.
+    """
+    buf = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buf), contextlib.redirect_stderr(buf):
+            return fn(raw_path, src), buf.getvalue(), None
+    except Exception as exc:
+        return None, buf.getvalue(), exc
+
+
+# Written to --results-out: one "<raw_path>\t<stage>" line per failed file.
+FAILED_LIST = "failed.txt"
+
+
+def _stage_loop(
+    name: str,
+    fns: Sequence[Callable[[str, str], str]],
+    pool: ProcessPoolExecutor,
+    q_in: "queue.Queue[Optional[Tuple[str, str]]]",
+    q_out: "Optional[queue.Queue[Optional[Tuple[str, str]]]]",
+    failures: List[Tuple[str, str]],
+    retries: int,
+    stop: Optional[threading.Event],
+    logger: batch_common.TaggedLogger,
+) -> None:
+    """
+    Consumer thread for one stage: pop (raw_path, src) items, run the stage
+    functions concurrently in the process pool and hand (raw_path, product
+    of the first one) to the next stage. A stage that fails is retried up
+    to `retries` times (only the functions that raised are run again); a
+    file that still fails is recorded in failures and dropped from the
+    pipeline. If stop is given, it is set on the first failure and pending
+    items are then dropped. The stage output and this thread's messages go
+    through logger.
+    """
+    while True:
+        item = q_in.get()
+        if item is _DONE:
+            return
+        if stop is not None and stop.is_set():
+            continue
+        raw_path, src = item
+        products: Dict[int, str] = {}
+        todo = list(range(len(fns)))
+        for attempt in range(retries + 1):
+            errors: List[Exception] = []
+            try:
+                futs = {i: pool.submit(_run_captured, fns[i], raw_path, src) for i in todo}
+            except Exception as exc:  # the pool is broken or shut down
+                futs, errors = {}, [exc]
+            wait(futs.values())
+            for i, fut in futs.items():
+                try:
+                    product, log, exc = fut.result()
+                except Exception as pool_exc:  # e.g. the worker process died
+                    product, log, exc = None, "", pool_exc
+                for line in log.splitlines():
+                    logger.log(None, line)
+                if exc is None:
+                    products[i] = product
+                else:
+                    errors.append(exc)
+            todo = [i for i in todo if i not in products]
+            if not todo:
+                break
+            if attempt < retries:
+                logger.log(None, f"[WARN] {name} failed for {raw_path}: {errors[0]!r}; "
+                                 f"retrying ({attempt + 1}/{retries})")
+                continue
+            logger.log(None, f"[ERROR] {name} failed for {raw_path}: {errors[0]!r}")
+            failures.append((raw_path, name))
+            if stop is not None:
+                stop.set()
+        if todo:
+            continue
+        product = products[0]
+        if q_out is not None:
+            q_out.put((raw_path, product))
+        else:
+            logger.log(None, f"[INFO] Finished file: {raw_path}")
+
+
+def run_pipeline(
+    inputs: List[str],
+    opts: Dict[str, Any],
+    results_out: str,
+    png_out: str,
+    jobs: int,
+    retries: int = 1,
+    stop_on_error: bool = False,
+) -> List[Tuple[str, str]]:
+    """
+    Run the stages as a pipeline across files: while file K is being
+    cleaned, file K+1 is already streaming from disk and the quicklook of
+    file K-1 is being drawn. Each stage is served by `jobs` consumer threads
+    that submit to one shared pool of `jobs` worker processes; bounded
+    queues between stages keep fast stages from running far ahead.
+
+    Failed stages are retried `retries` times. Other files keep going past
+    a file that still fails, unless stop_on_error is set: then no new file
+    is started and queued ones are dropped after the first failure.
+
+    Returns the list of (raw_path, stage) failures.
+    """
+    clean: Tuple[Callable[..., str], ...] = (stage_clean,)
+    if opts["fixed_scale"]:
+        clean += (stage_skstream_quicklook,)
+    stages = [
+        ("stream", (stage_stream,)),
+        ("clean", clean),
+        ("quicklook", (stage_final,)),
+    ]
+    queues: List["queue.Queue[Optional[Tuple[str, str]]]"] = [
+        queue.Queue(maxsize=2 * jobs) for _ in stages
+    ]
+    failures: List[Tuple[str, str]] = []
+    stop = threading.Event() if stop_on_error else None
+
+    with batch_common.TaggedLogger() as logger, ProcessPoolExecutor(
+        max_workers=jobs, mp_context=_mp_context()
+    ) as pool:
+        threads: List[List[threading.Thread]] = []
+        for i, (name, fns) in enumerate(stages):
+            bound = [
+                functools.partial(fn, opts=opts, results_out=results_out, png_out=png_out)
+                for fn in fns
+            ]
+            q_out = queues[i + 1] if i + 1 < len(stages) else None
+            workers = [
+                threading.Thread(
+                    target=_stage_loop,
+                    args=(name, bound, pool, queues[i], q_out, failures, retries, stop, logger),
+                    daemon=True,
+                )
+                for _ in range(jobs)
+            ]
+            for t in workers:
+                t.start()
+            threads.append(workers)
+
+        # Producer: feed raw files, then drain the stages in order.
+        for raw_path in inputs:
+            if stop is not None and stop.is_set():
+                break
+            queues[0].put((raw_path, raw_path))
+        for q, workers in zip(queues, threads):
+            for _ in workers:
+                q.put(_DONE)
+            for t in workers:
+                t.join()
+
+    return failures
+
+
 # ----------------------------------------------------------------------
 # Main orchestrator
 # ----------------------------------------------------------------------
 def main() -> None:
     ap = argparse.ArgumentParser(
         description=(
-            "Batch OVRO-LWA SK pipeline: stream → quicklook (stage1) → "
-            "RFI clean → quicklook (RFI)."
+            "Batch OVRO-LWA SK pipeline: stream → RFI clean → "
+            "quicklooks (stage1 + RFI)."
         )
     )
 
@@ -110,6 +860,12 @@ def main() -> None:
         default="*",
         help="Glob pattern within --indir (default: '*').",
     )
+    ap.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Only take the first N (sorted) matches of --indir/--pattern.",
+    )
 
     # Output locations
     ap.add_argument(
@@ -208,19 +964,71 @@ def main() -> None:
     ap.add_argument(
         "--no-show",
         action="store_true",
-        help="Do not attempt to show figures (recommended on headless systems).",
+        help=(
+            "Accepted for compatibility; figures are always rendered "
+            "off-screen (Agg) and saved, never shown."
+        ),
     )
 
     ap.add_argument(
         "--dry-run",
         action="store_true",
-        help="Print what would be done, but do not run any commands.",
+        help="Print what would be done, but do not run any stage.",
+    )
+    ap.add_argument(
+        "--tmpfs-intermediate",
+        action="store_true",
+        help=(
+            "Write the *_skstream.h5 intermediates to a private directory in "
+            "/dev/shm (deleted after the quicklooks and at exit) instead of "
+            "--results-out. Only the RFI-clean products and PNGs are kept; "
+            "their cache fingerprints are then chained from the raw file, and "
+            "Stage 1 is skipped for files whose products are all up to date."
+        ),
+    )
+    ap.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-run every stage even if its output is up to date.",
+    )
+    ap.add_argument(
+        "--emit-makefile",
+        metavar="PATH",
+        default=None,
+        help=(
+            "Write a Makefile with one rule per product and file to PATH and "
+            "run it with 'make -j<jobs> -k' instead of the in-process pipeline. "
+            "make skips products newer than their inputs (by mtime only)."
+        ),
+    )
+    ap.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="Number of times a failed stage is retried for a file (default: 1).",
+    )
+    ap.add_argument(
+        "--stop-on-error",
+        action="store_true",
+        help=(
+            "Stop at the first file that fails (after retries) instead of "
+            "skipping it and continuing; in-flight files still finish."
+        ),
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help=(
+            "Number of worker processes shared by the pipeline stages "
+            "(default: min(number of CPUs, number of input files))."
+        ),
     )
 
     args = ap.parse_args()
 
     # Prepare input list
-    inputs = _find_inputs(args.files, args.indir, args.pattern)
+    inputs = _find_inputs(args.files, args.indir, args.pattern, args.limit)
     results_out = os.path.abspath(args.results_out)
     png_out = os.path.abspath(args.png_out)
 
@@ -233,116 +1041,53 @@ def main() -> None:
     print(f"[INFO] PNG output directory : {png_out}")
     print("============================================================")
 
-    # Loop over each raw input file
-    for raw_path in inputs:
-        base = _base_from_raw(raw_path)
-        print("============================================================")
-        print(f"[INFO] Processing raw file: {raw_path}")
-        print("------------------------------------------------------------")
-
-        # ---------------------------------------------------------
-        # 1) Stage 1: SK streaming → *_skstream.h5
-        # ---------------------------------------------------------
-        skstream_out = os.path.join(results_out, f"{base}_skstream.h5")
-
-        stream_cmd = [
-            sys.executable,
-            "ovro_lwa_sk_stream.py",
-            raw_path,
-            "--M", str(args.M),
-            "--N", str(args.N),
-            "--d", str(args.d),
-            "--pfa", str(args.pfa),
-            "--start-idx", str(args.start_idx),
-            "--out", skstream_out,
-        ]
-        if args.ns_max is not None:
-            stream_cmd.extend(["--ns-max", str(args.ns_max)])
-
-        print(f"[INFO] [Stage 1] Streaming to: {skstream_out}")
-        if not args.dry_run:
-            _run(stream_cmd)
-
-        # ---------------------------------------------------------
-        # 2) Stage 1 quicklook on *_skstream.h5
-        # ---------------------------------------------------------
-        print("[INFO] [Stage 1] Quicklook for SK-stream product...")
-        ql1_cmd = [
-            sys.executable,
-            "ovro_lwa_sk_quicklook.py",
-            skstream_out,
-            "--pol", args.pol,
-            "--scale", args.scale,
-            "--save-plot", "png",
-            "--out", png_out,
-        ]
-        if args.vmin is not None:
-            ql1_cmd.extend(["--vmin", str(args.vmin)])
-        if args.vmax is not None:
-            ql1_cmd.extend(["--vmax", str(args.vmax)])
-        if args.log_eps is not None:
-            ql1_cmd.extend(["--log-eps", str(args.log_eps)])
-        if args.transparent:
-            ql1_cmd.append("--transparent")
-        if args.no_show:
-            ql1_cmd.append("--no-show")
+    jobs = args.jobs if args.jobs is not None else min(os.cpu_count() or 1, len(inputs))
+    jobs = max(1, jobs)
+    print(f"[INFO] Running with {jobs} parallel job(s).")
 
-        if not args.dry_run:
-            _run(ql1_cmd)
-
-        # ---------------------------------------------------------
-        # 3) Stage 2: RFI cleaning → *_skstream_rfi_...h5
-        # ---------------------------------------------------------
-        print("[INFO] [Stage 2] RFI cleaning...")
-        rfi_cmd = [
-            sys.executable,
-            "ovro_lwa_rfi_clean.py",
-            skstream_out,
-            "--F-block", str(args.F_block),
-            "--flag-mode", args.flag_mode,
-            "--out", results_out,
-        ]
-        if not args.dry_run:
-            _run(rfi_cmd)
-
-        # We know the naming convention from rfi_clean:
-        # <base>_skstream_rfi_M<M>_F<F_block>_<flag_mode>.h5
-        rfi_out = os.path.join(
-            results_out,
-            f"{base}_skstream_rfi_M{args.M}_F{args.F_block}_{args.flag_mode}.h5",
+    if args.emit_makefile:
+        opts = _stage_options(args, png_out, results_out)
+        write_makefile(args.emit_makefile, inputs, opts, results_out, png_out)
+        print(f"[INFO] Makefile written to: {os.path.abspath(args.emit_makefile)}")
+        ret = run_make(
+            args.emit_makefile, jobs,
+            keep_going=not args.stop_on_error, force=args.force, dry_run=args.dry_run,
         )
-        print(f"[INFO] [Stage 2] RFI-clean product: {rfi_out}")
-
-        # ---------------------------------------------------------
-        # 4) Stage 2 quicklook on RFI-clean product
-        # ---------------------------------------------------------
-        print("[INFO] [Stage 2] Quicklook for RFI-clean product...")
-        ql2_cmd = [
-            sys.executable,
-            "ovro_lwa_sk_quicklook.py",
-            rfi_out,
-            "--pol", args.pol,
-            "--scale", args.scale,
-            "--save-plot", "png",
-            "--out", png_out,
-        ]
-        if args.vmin is not None:
-            ql2_cmd.extend(["--vmin", str(args.vmin)])
-        if args.vmax is not None:
-            ql2_cmd.extend(["--vmax", str(args.vmax)])
-        if args.log_eps is not None:
-            ql2_cmd.extend(["--log-eps", str(args.log_eps)])
-        if args.transparent:
-            ql2_cmd.append("--transparent")
-        if args.no_show:
-            ql2_cmd.append("--no-show")
+        if ret != 0:
+            print(f"[ERROR] make exited with code {ret}")
+            raise SystemExit(1)
+        print("[INFO] Batch pipeline complete.")
+        return
 
-        if not args.dry_run:
-            _run(ql2_cmd)
+    intermediate_dir = results_out
+    if args.tmpfs_intermediate:
+        intermediate_dir = _tmpfs_intermediate_dir(inputs, args.M, jobs) or results_out
+        print(f"[INFO] SK-stream intermediates in: {intermediate_dir}")
 
-        print(f"[INFO] Finished file: {raw_path}")
+    opts = _stage_options(args, png_out, intermediate_dir)
+    failures = run_pipeline(
+        inputs, opts, results_out, png_out, jobs,
+        retries=max(0, args.retries),
+        stop_on_error=args.stop_on_error,
+    )
 
+    # failed.txt lists the failures of the latest run only.
+    failed_txt = os.path.join(results_out, FAILED_LIST)
     print("============================================================")
+    if failures:
+        print(f"[ERROR] {len(failures)} file(s) failed:")
+        for raw_path, stage in failures:
+            print(f"[ERROR]   {raw_path} (stage: {stage})")
+        if not args.dry_run:
+            with open(failed_txt, "w") as fh:
+                for raw_path, stage in failures:
+                    fh.write(f"{raw_path}\t{stage}\n")
+            print(f"[ERROR] Failed files listed in: {failed_txt}")
+        print("============================================================")
+        raise SystemExit(1)
+    if not args.dry_run:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(failed_txt)
     print("[INFO] Batch pipeline complete.")
     print("============================================================")
 
@@ -8,14 +8,20 @@ Batch wrapper around ovro_lwa_sk_quicklook.py to generate and save PNG quicklook
 from __future__ import annotations
 
 import argparse
-import glob
 import os
-import subprocess
 import sys
-from typing import List
+from typing import List, Tuple
 
+import ovro_lwa_batch_common as batch_common
+import ovro_lwa_sk_quicklook as sk_quicklook
 
-def _collect_inputs(files: List[str], indir: str | None, pattern: str) -> List[str]:
+
+def _collect_inputs(
+    files: List[str],
+    indir: str | None,
+    pattern: str,
+    limit: int | None = None,
+) -> List[str]:
     paths: List[str] = []
 
     for f in files:
@@ -25,22 +31,13 @@ def _collect_inputs(files: List[str], indir: str | None, pattern: str) -> List[s
             print(f"[WARN] Input file not found, skipping: {f}")
 
     if indir is not None:
-        indir = os.path.abspath(indir)
-        glob_pattern = os.path.join(indir, pattern)
-        found = sorted(glob.glob(glob_pattern))
+        found = batch_common.scan_dir(indir, pattern, limit)
         if not found:
-            print(f"[WARN] No files matched pattern '{glob_pattern}'")
+            print(f"[WARN] No files matched pattern '{os.path.join(os.path.abspath(indir), pattern)}'")
         else:
             paths.extend(found)
 
-    seen = set()
-    uniq = []
-    for p in paths:
-        if p not in seen:
-            seen.add(p)
-            uniq.append(p)
-
-    return uniq
+    return batch_common.readable_hdf5(list(dict.fromkeys(paths)))
 
 
 def main() -> None:
@@ -65,6 +62,12 @@ def main() -> None:
         default="*.h5",
         help="Glob pattern within --indir (default: '*.h5').",
     )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Only take the first N (sorted) matches of --indir/--pattern.",
+    )
     parser.add_argument(
         "--outdir",
         type=str,
@@ -76,6 +79,26 @@ def main() -> None:
         action="store_true",
         help="Print the commands that would be run, but do not execute them.",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-run files whose output is already up to date.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of chunks to process in parallel (default: min(#CPUs, #files)).",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=32,
+        help=(
+            "Maximum number of files handled by one stage-script invocation "
+            "(default: 32; lowered automatically so that all jobs get work)."
+        ),
+    )
 
     # Plot options mirrored from ovro_lwa_sk_quicklook.py
     parser.add_argument(
@@ -122,7 +145,7 @@ def main() -> None:
 
     args = parser.parse_args()
 
-    inputs = _collect_inputs(args.files, args.indir, args.pattern)
+    inputs = _collect_inputs(args.files, args.indir, args.pattern, args.limit)
     if not inputs:
         parser.error("No input files found. Provide files and/or --indir/--pattern.")
 
@@ -132,43 +155,62 @@ def main() -> None:
     os.makedirs(args.outdir, exist_ok=True)
     print(f"[INFO] Output directory for PNG quicklooks: {os.path.abspath(args.outdir)}")
 
+    params = dict(
+        pol=args.pol,
+        scale=args.scale,
+        vmin=args.vmin,
+        vmax=args.vmax,
+        log_eps=args.log_eps,
+        dpi=args.dpi,
+        transparent=args.transparent,
+        out=args.outdir,
+    )
+    opts = [
+        "--pol",
+        args.pol,
+        "--scale",
+        args.scale,
+        "--save-plot",
+        "png",
+        "--out",
+        args.outdir,
+        "--dpi",
+        str(args.dpi),
+        "--no-show",
+    ]
+    if args.vmin is not None:
+        opts.extend(["--vmin", str(args.vmin)])
+    if args.vmax is not None:
+        opts.extend(["--vmax", str(args.vmax)])
+    if args.log_eps is not None:
+        opts.extend(["--log-eps", str(args.log_eps)])
+    if args.transparent:
+        opts.append("--transparent")
+
+    pending: List[Tuple[str, str, str]] = []
     for path in inputs:
         print("=" * 60)
         print(f"[INFO] Quicklook for file: {path}")
 
-        cmd = [
-            sys.executable,
-            ql_script,
-            path,
-            "--pol",
-            args.pol,
-            "--scale",
-            args.scale,
-            "--save-plot",
-            "png",
-            "--out",
-            args.outdir,
-            "--dpi",
-            str(args.dpi),
-            "--no-show",
-        ]
-        if args.vmin is not None:
-            cmd.extend(["--vmin", str(args.vmin)])
-        if args.vmax is not None:
-            cmd.extend(["--vmax", str(args.vmax)])
-        if args.log_eps is not None:
-            cmd.extend(["--log-eps", str(args.log_eps)])
-        if args.transparent:
-            cmd.append("--transparent")
-
-        print("[INFO] Command:", " ".join(cmd))
-        if args.dry_run:
-            print("[DRY-RUN] Not executing.")
+        try:
+            out_path = sk_quicklook.output_path(path, args.pol, "png", args.outdir)
+        except (OSError, ValueError) as exc:
+            print(f"[ERROR] Cannot read {path}: {exc}")
             continue
-
-        ret = subprocess.call(cmd)
-        if ret != 0:
-            print(f"[ERROR] ovro_lwa_sk_quicklook.py failed for {path} (exit code {ret})")
+        fp = batch_common.fingerprint(path, params, ql_script)
+        if not args.force and batch_common.is_up_to_date(out_path, fp):
+            print(f"[SKIP] Up to date: {out_path}")
+            continue
+        pending.append((path, out_path, fp))
+
+    batch_common.run_batches(
+        pending,
+        lambda paths: [sys.executable, ql_script, *paths, *opts],
+        jobs=args.jobs,
+        chunk_size=args.chunk_size,
+        dry_run=args.dry_run,
+        script_name="ovro_lwa_sk_quicklook.py",
+    )
 
     print("=" * 60)
     print("[INFO] Batch quicklook generation finished.")
@@ -22,14 +22,20 @@ python ovro_lwa_batch_stream.py \
 from __future__ import annotations
 
 import argparse
-import glob
 import os
-import subprocess
 import sys
-from typing import List
+from typing import List, Tuple
 
+import ovro_lwa_batch_common as batch_common
+import ovro_lwa_sk_stream as sk_stream
 
-def _collect_inputs(files: List[str], indir: str | None, pattern: str) -> List[str]:
+
+def _collect_inputs(
+    files: List[str],
+    indir: str | None,
+    pattern: str,
+    limit: int | None = None,
+) -> List[str]:
     paths: List[str] = []
 
     # Explicit files
@@ -41,23 +47,14 @@ def _collect_inputs(files: List[str], indir: str | None, pattern: str) -> List[s
 
     # From directory + pattern
     if indir is not None:
-        indir = os.path.abspath(indir)
-        glob_pattern = os.path.join(indir, pattern)
-        found = sorted(glob.glob(glob_pattern))
+        found = batch_common.scan_dir(indir, pattern, limit)
         if not found:
-            print(f"[WARN] No files matched pattern '{glob_pattern}'")
+            print(f"[WARN] No files matched pattern '{os.path.join(os.path.abspath(indir), pattern)}'")
         else:
             paths.extend(found)
 
-    # Make unique, preserve order
-    seen = set()
-    uniq = []
-    for p in paths:
-        if p not in seen:
-            seen.add(p)
-            uniq.append(p)
-
-    return uniq
+    # Make unique (preserving order), then drop unreadable files
+    return batch_common.readable_hdf5(list(dict.fromkeys(paths)))
 
 
 def main() -> None:
@@ -82,6 +79,12 @@ def main() -> None:
         default="*",
         help="Glob pattern within --indir (default: '*').",
     )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Only take the first N (sorted) matches of --indir/--pattern.",
+    )
     parser.add_argument(
         "--outdir",
         type=str,
@@ -93,6 +96,26 @@ def main() -> None:
         action="store_true",
         help="Print the commands that would be run, but do not execute them.",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-run files whose output is already up to date.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of chunks to process in parallel (default: min(#CPUs, #files)).",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=32,
+        help=(
+            "Maximum number of files handled by one stage-script invocation "
+            "(default: 32; lowered automatically so that all jobs get work)."
+        ),
+    )
 
     # Forwarded SK-stream options (mirroring ovro_lwa_sk_stream.py)
     parser.add_argument("--M", type=int, default=64, help="Block length M.")
@@ -119,7 +142,7 @@ def main() -> None:
 
     args = parser.parse_args()
 
-    inputs = _collect_inputs(args.files, args.indir, args.pattern)
+    inputs = _collect_inputs(args.files, args.indir, args.pattern, args.limit)
     if not inputs:
         parser.error("No input files found. Provide files and/or --indir/--pattern.")
 
@@ -129,38 +152,51 @@ def main() -> None:
     os.makedirs(args.outdir, exist_ok=True)
     print(f"[INFO] Output directory for SK stream: {os.path.abspath(args.outdir)}")
 
+    params = dict(
+        M=args.M,
+        N=args.N,
+        d=args.d,
+        pfa=args.pfa,
+        start_idx=args.start_idx,
+        ns_max=args.ns_max,
+    )
+    opts = [
+        "--M",
+        str(args.M),
+        "--N",
+        str(args.N),
+        "--d",
+        str(args.d),
+        "--pfa",
+        str(args.pfa),
+        "--start-idx",
+        str(args.start_idx),
+        "--out",
+        args.outdir,
+    ]
+    if args.ns_max is not None:
+        opts.extend(["--ns-max", str(args.ns_max)])
+
+    pending: List[Tuple[str, str, str]] = []
     for path in inputs:
         print("=" * 60)
         print(f"[INFO] Processing raw file: {path}")
 
-        cmd = [
-            sys.executable,
-            stream_script,
-            path,
-            "--M",
-            str(args.M),
-            "--N",
-            str(args.N),
-            "--d",
-            str(args.d),
-            "--pfa",
-            str(args.pfa),
-            "--start-idx",
-            str(args.start_idx),
-            "--out",
-            args.outdir,
-        ]
-        if args.ns_max is not None:
-            cmd.extend(["--ns-max", str(args.ns_max)])
-
-        print("[INFO] Command:", " ".join(cmd))
-        if args.dry_run:
-            print("[DRY-RUN] Not executing.")
+        _raw, out_path = sk_stream.resolve_paths(path, args.outdir)
+        fp = batch_common.fingerprint(path, params, stream_script)
+        if not args.force and batch_common.is_up_to_date(out_path, fp):
+            print(f"[SKIP] Up to date: {out_path}")
             continue
-
-        ret = subprocess.call(cmd)
-        if ret != 0:
-            print(f"[ERROR] ovro_lwa_sk_stream.py failed for {path} (exit code {ret})")
+        pending.append((path, out_path, fp))
+
+    batch_common.run_batches(
+        pending,
+        lambda paths: [sys.executable, stream_script, *paths, *opts],
+        jobs=args.jobs,
+        chunk_size=args.chunk_size,
+        dry_run=args.dry_run,
+        script_name="ovro_lwa_sk_stream.py",
+    )
 
     print("=" * 60)
     print("[INFO] Batch SK streaming finished.")
@@ -40,9 +40,11 @@ import argparse
 import glob
 import os
 import sys
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 
+import ovro_lwa_batch_common as batch_common
+
 
 def _expand_inputs(patterns: List[str]) -> List[str]:
     """
@@ -60,13 +62,72 @@ def _expand_inputs(patterns: List[str]) -> List[str]:
             out.append(p)
 
     # Deduplicate while preserving order
-    seen = set()
-    uniq: List[str] = []
-    for f in out:
-        if f not in seen:
-            seen.add(f)
-            uniq.append(f)
-    return uniq
+    return list(dict.fromkeys(out))
+
+
+def _run_pol(
+    h5: str,
+    pol: str,
+    ovro_script: str,
+    outdir: str,
+    passthrough: List[str],
+    logger: batch_common.TaggedLogger,
+) -> int:
+    """Run ovro-lwa.py for one polarization of one file; return its exit code."""
+    tag = f"{os.path.basename(h5)}:{pol}"
+    cmd = [
+        sys.executable,
+        ovro_script,
+        h5,
+        "--pol",
+        pol,
+        "--outdir",
+        outdir,
+    ]
+    cmd.extend(passthrough)
+
+    logger.log(tag, f"[INFO]   Running ovro-lwa.py for pol={pol}")
+    logger.log(tag, f"[INFO]   Command: {' '.join(cmd)}")
+
+    ret, _out = batch_common.call(cmd, tag, logger)
+    if ret != 0:
+        logger.log(
+            tag,
+            f"[WARN] ovro-lwa.py exited with code {ret} "
+            f"for file={h5}, pol={pol}",
+        )
+    else:
+        logger.log(tag, f"[INFO]   Completed successfully for pol={pol}")
+    return ret
+
+
+def _process_file(
+    h5: str,
+    ovro_script: str,
+    pol_list: List[str],
+    outdir: str,
+    passthrough: List[str],
+    logger: batch_common.TaggedLogger,
+) -> None:
+    """
+    Run ovro-lwa.py for each requested polarization of one input file.
+
+    The polarizations read the same input but write independent outputs,
+    so they run concurrently (the work happens in the child processes).
+    Child output is streamed to the shared logger with a [basename:pol]
+    prefix, so concurrent runs stay readable.
+    """
+    logger.log(os.path.basename(h5), f"[INFO] Processing input: {h5}")
+    if len(pol_list) == 1:
+        _run_pol(h5, pol_list[0], ovro_script, outdir, passthrough, logger)
+        return
+    with ThreadPoolExecutor(max_workers=len(pol_list)) as ex:
+        futs = [
+            ex.submit(_run_pol, h5, pol, ovro_script, outdir, passthrough, logger)
+            for pol in pol_list
+        ]
+        for fut in futs:
+            fut.result()
 
 
 def main() -> None:
@@ -90,7 +151,7 @@ def main() -> None:
         default="both",
         help=(
             "Which polarization(s) to process. "
-            "'both' runs ovro-lwa.py twice (XX and YY). Default: both."
+            "'both' runs ovro-lwa.py twice (XX and YY, concurrently). Default: both."
         ),
     )
     parser.add_argument(
@@ -101,6 +162,12 @@ def main() -> None:
             "Defaults to current directory."
         ),
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of input files to process in parallel (default: min(#CPUs, #files)).",
+    )
 
     # Everything else is passed through unchanged to ovro-lwa.py
     args, passthrough = parser.parse_known_args()
@@ -130,32 +197,12 @@ def main() -> None:
     print(f"[INFO] Extra arguments passed through to ovro-lwa.py: {' '.join(passthrough) or '(none)'}")
     print("============================================================")
 
-    for h5 in files:
-        print("------------------------------------------------------------")
-        print(f"[INFO] Processing input: {h5}")
-        for pol in pol_list:
-            cmd = [
-                sys.executable,
-                ovro_script,
-                h5,
-                "--pol",
-                pol,
-                "--outdir",
-                args.outdir,
-            ]
-            cmd.extend(passthrough)
-
-            print(f"[INFO]   Running ovro-lwa.py for pol={pol}")
-            print(f"[INFO]   Command: {' '.join(cmd)}")
-
-            result = subprocess.run(cmd)
-            if result.returncode != 0:
-                print(
-                    f"[WARN] ovro-lwa.py exited with code {result.returncode} "
-                    f"for file={h5}, pol={pol}"
-                )
-            else:
-                print(f"[INFO]   Completed successfully for pol={pol}")
+    jobs = args.jobs if args.jobs is not None else min(os.cpu_count() or 1, len(files))
+    with batch_common.TaggedLogger() as logger, ThreadPoolExecutor(max_workers=max(1, jobs)) as ex:
+        list(ex.map(
+            lambda h5: _process_file(h5, ovro_script, pol_list, args.outdir, passthrough, logger),
+            files,
+        ))
 
     print("============================================================")
     print("[INFO] Batch two-stage processing complete.")
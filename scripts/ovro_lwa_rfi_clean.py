@@ -34,12 +34,15 @@ Processing:
 
 Output:
     HDF5 file with datasets:
-        s1_xx_clean     (T, n_blocks)    if XX present
-        s1_yy_clean     (T, n_blocks)    if YY present
-        mask_xx         (T, n_blocks)    n_good per block for XX (or shared)
-        mask_yy         (T, n_blocks)    n_good per block for YY (or shared)
+        s1_xx_clean     (T, n_blocks)    float32, if XX present
+        s1_yy_clean     (T, n_blocks)    float32, if YY present
+        mask_xx         (T, n_blocks)    uint8, n_good per block for XX (or shared)
+        mask_yy         (T, n_blocks)    uint8, n_good per block for YY (or shared)
+    (masks are uint16 if F_block > 255)
         freq_block_hz   (n_blocks,)      block-averaged frequencies
         time_blk        (T,)
+    The (T, n_blocks) datasets are chunked one row tile high and written
+    with LZF + byte shuffle by default (see --compression).
 
     root attributes:
         M, N, d, pfa  (copied from input, if present)
@@ -59,12 +62,31 @@ Filename:
 from __future__ import annotations
 
 import argparse
+import contextlib
+import functools
 import os
-from typing import Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterator, Optional, Tuple
 
 import h5py
 import numpy as np
 
+import ovro_lwa_batch_common as batch_common
+
+# Approximate float32 working-set size of one (rows, F) tile per array;
+# the input is read, cleaned and written one tile of rows at a time, so
+# reading, masking, block sums and the write all reuse data that is still
+# in cache (s1, mask and temporaries of a tile fit a typical 1-2 MiB L2;
+# smaller tiles only add per-call overhead).
+TILE_BYTES = 1 << 20
+
+# Inputs with at least this many samples per polarization are cleaned by
+# the numba kernel, if numba is installed. Below it, importing numba and
+# loading the cached kernel costs more than it saves. Files with fewer
+# than NUMBA_MIN_ROWS time rows also stay on numpy: there are too few
+# blocks per tile to be worth splitting across threads.
+NUMBA_MIN_SAMPLES = 1 << 27
+NUMBA_MIN_ROWS = 128
 
 # ----------------------------------------------------------------------
 # Helpers
@@ -94,65 +116,236 @@ def _build_output_path(
     return os.path.join(out_dir, fname)
 
 
-def _load_skstream(skfile: str) -> Dict[str, Any]:
+@contextlib.contextmanager
+def _open_h5(src: str | h5py.File) -> Iterator[h5py.File]:
+    """
+    Yield an open h5py.File for src. An already-open handle is passed
+    through and left open, so callers can reuse one handle across steps.
+    """
+    if isinstance(src, h5py.File):
+        yield src
+    else:
+        with h5py.File(src, "r") as f:
+            yield f
+
+
+def _h5_name(src: str | h5py.File) -> str:
+    """File name of a path or an open handle."""
+    return src.filename if isinstance(src, h5py.File) else src
+
+
+def _load_skstream(f: h5py.File) -> Dict[str, Any]:
     """
-    Load SK-stream product produced by ovro_lwa_sk_stream.py.
+    Open the SK-stream product produced by ovro_lwa_sk_stream.py for
+    streaming: the (T, F) datasets are returned as h5py.Dataset handles
+    of the open file f, to be read in row tiles (see _row_tile), and only
+    the 1-D axes are loaded.
 
     Returns a dict with:
-        s1_xx, s1_yy, flags_xx, flags_yy, freq_hz, time_blk,
+        s1_xx, s1_yy, flags_xx, flags_yy (datasets), freq_hz, time_blk,
         has_xx, has_yy, attrs (M, N, d, pfa when present)
     """
     data: Dict[str, Any] = {}
-    with h5py.File(skfile, "r") as f:
-        # Basic datasets
-        if "freq_hz" not in f or "time_blk" not in f:
-            raise KeyError("Input file must contain 'freq_hz' and 'time_blk' datasets.")
-
-        freq_hz = np.asarray(f["freq_hz"][:], float)
-        time_blk = np.asarray(f["time_blk"][:], float)
-        data["freq_hz"] = freq_hz
-        data["time_blk"] = time_blk
-
-        has_xx = ("s1_xx" in f) and ("sk_flags_xx" in f)
-        has_yy = ("s1_yy" in f) and ("sk_flags_yy" in f)
-        data["has_xx"] = has_xx
-        data["has_yy"] = has_yy
-
-        if not (has_xx or has_yy):
-            raise KeyError(
-                "SK-stream file must contain at least one of "
-                "('s1_xx' & 'sk_flags_xx') or ('s1_yy' & 'sk_flags_yy')."
-            )
 
-        if has_xx:
-            data["s1_xx"] = np.asarray(f["s1_xx"][:], float)
-            data["flags_xx"] = np.asarray(f["sk_flags_xx"][:], float)
-        if has_yy:
-            data["s1_yy"] = np.asarray(f["s1_yy"][:], float)
-            data["flags_yy"] = np.asarray(f["sk_flags_yy"][:], float)
+    # Basic datasets
+    if "freq_hz" not in f or "time_blk" not in f:
+        raise KeyError("Input file must contain 'freq_hz' and 'time_blk' datasets.")
+
+    freq_hz = f["freq_hz"][()]  # stored dtype; averaged in float64 below
+    time_blk = np.asarray(f["time_blk"][:], float)
+    data["freq_hz"] = freq_hz
+    data["time_blk"] = time_blk
+
+    has_xx = ("s1_xx" in f) and ("sk_flags_xx" in f)
+    has_yy = ("s1_yy" in f) and ("sk_flags_yy" in f)
+    data["has_xx"] = has_xx
+    data["has_yy"] = has_yy
+
+    if not (has_xx or has_yy):
+        raise KeyError(
+            "SK-stream file must contain at least one of "
+            "('s1_xx' & 'sk_flags_xx') or ('s1_yy' & 'sk_flags_yy')."
+        )
+
+    if has_xx:
+        data["s1_xx"] = f["s1_xx"]
+        data["flags_xx"] = f["sk_flags_xx"]
+    if has_yy:
+        data["s1_yy"] = f["s1_yy"]
+        data["flags_yy"] = f["sk_flags_yy"]
 
-        # Attributes: M, N, d, pfa if present
-        attrs = {}
-        for key in ("M", "N", "d", "pfa"):
-            if key in f.attrs:
-                attrs[key] = f.attrs[key]
-        data["attrs"] = attrs
+    # Attributes: M, N, d, pfa if present
+    # One pass over the attribute list instead of an exists+open per key
+    all_attrs = dict(f.attrs)
+    attrs = {k: all_attrs[k] for k in ("M", "N", "d", "pfa") if k in all_attrs}
+    data["attrs"] = attrs
 
     return data
 
 
+def _row_tile(ds: h5py.Dataset, row_bytes: int) -> int:
+    """
+    Number of time rows to read per tile: about TILE_BYTES of float32 work
+    per array (row_bytes per row), rounded to whole chunk rows of ds so
+    that no input chunk is decompressed twice.
+    """
+    rows = max(1, TILE_BYTES // max(1, row_bytes))
+    if ds.chunks is not None:
+        ct = ds.chunks[0]
+        rows = max(ct, rows // ct * ct)
+    return min(rows, max(1, ds.shape[0]))
+
+
+@functools.lru_cache(maxsize=None)
+def _clean_kernel(F_block: int) -> Optional[Callable[..., None]]:
+    """
+    Compiled gufunc kernel(s1_blk, good_blk, out=(s1_clean, mask)) doing
+    the block integration of _clean_with_good_mask for (..., F_block)
+    float32 s1 and uint8 good blocks (reshaped (T, n_blocks, F_block)
+    views), without temporaries: s1_clean (NaN where no channel is good)
+    and the good-channel count per block. Blocks run in parallel on
+    numba's thread pool (target='parallel'); see _set_numba_threads.
+    None if numba is not available.
+
+    The default F_block=8 gets its own kernel with the block length as a
+    compile-time constant, so the inner loop is fully unrolled (~25%
+    faster). Other block sizes share a kernel with a runtime trip count.
+    The two kernels are separate functions on purpose: numba's on-disk
+    cache does not key parallel gufuncs on closure variables, so a closure
+    over F_block can load the kernel of another block size, and closing
+    over a shared jitted helper recompiles (and re-caches) on every run.
+    """
+    try:
+        from numba import float32, guvectorize, uint8, uint16  # type: ignore
+    except Exception:
+        return None
+
+    gufunc = guvectorize(
+        [(float32[:], uint8[:], float32[:], uint16[:])],
+        "(n),(n)->(),()",
+        nopython=True,
+        target="parallel",
+        cache=True,
+    )
+
+    if F_block == 8:
+        @gufunc
+        def _clean_f8(s1, good, s1_clean, count):
+            s = np.float32(0.0)
+            c = 0
+            for k in range(8):
+                g = good[k]
+                s += s1[k] * np.float32(g)
+                c += g
+            count[0] = c
+            if c == 0:
+                s1_clean[0] = np.nan
+            else:
+                s1_clean[0] = (s / np.float32(c)) * np.float32(8)
+
+        return _clean_f8
+
+    @gufunc
+    def _clean(s1, good, s1_clean, count):
+        s = np.float32(0.0)
+        c = 0
+        for k in range(s1.shape[0]):
+            g = good[k]
+            s += s1[k] * np.float32(g)
+            c += g
+        # Storing count first lets LLVM keep c in a register (~2x faster)
+        count[0] = c
+        if c == 0:
+            s1_clean[0] = np.nan
+        else:
+            s1_clean[0] = (s / np.float32(c)) * np.float32(s1.shape[0])
+
+    return _clean
+
+
+def _set_numba_threads(num_threads: int) -> None:
+    """
+    Run the numba kernel on num_threads threads (capped at numba's
+    NUMBA_NUM_THREADS, by default the number of CPUs). Set it explicitly
+    when several cleaning processes share a node, to avoid
+    oversubscription. Which threading layer runs the pool is chosen with
+    the NUMBA_THREADING_LAYER environment variable ('tbb' if installed
+    balances uneven work best; 'omp' or 'workqueue' otherwise).
+    """
+    import numba  # type: ignore
+
+    n_max = numba.config.NUMBA_NUM_THREADS
+    if num_threads > n_max:
+        print(f"[WARN] --num-threads {num_threads} exceeds NUMBA_NUM_THREADS={n_max}; using {n_max}.")
+        num_threads = n_max
+    numba.set_num_threads(num_threads)
+
+
+def _mask_dtype(F_block: int) -> np.dtype:
+    """Smallest unsigned integer dtype holding good-channel counts 0..F_block."""
+    if F_block > np.iinfo(np.uint16).max:
+        raise ValueError(f"F_block={F_block} too large for a uint16 mask.")
+    return np.dtype(np.uint8 if F_block <= np.iinfo(np.uint8).max else np.uint16)
+
+
+def _compression_filters(compression: Optional[str]) -> Dict[str, Any]:
+    """
+    create_dataset keyword arguments for the compression choice of
+    rfi_clean ('lzf', 'gzip', 'zstd' or None), byte shuffle included.
+    """
+    if compression is None:
+        return {}
+    if compression == "zstd":
+        try:
+            import hdf5plugin  # type: ignore
+        except ImportError as exc:
+            raise ImportError("compression='zstd' requires the hdf5plugin package.") from exc
+        return dict(hdf5plugin.Blosc(cname="zstd", clevel=3, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    return dict(compression=compression, shuffle=True)
+
+
+def _block_weights(good: np.ndarray, F_block: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-block reductions of a (T, F) boolean good mask that do not depend
+    on s1: the float32 (T, n_blocks, F_block) weights (1.0 good, 0.0 bad)
+    and the (T, n_blocks) good-channel counts in _mask_dtype(F_block).
+    """
+    T, F = good.shape
+    n_blocks = F // F_block
+    F_eff = n_blocks * F_block
+    good_v = good[:, :F_eff].astype(np.float32).reshape(T, n_blocks, F_block)
+
+    # For blocks of 8-64 channels, pack the mask to one bit per channel,
+    # view each block as one 8-64 bit word and popcount it
+    mask_dtype = _mask_dtype(F_block)
+    if F_block in (8, 16, 32, 64) and hasattr(np, "bitwise_count"):
+        packed = np.packbits(good[:, :F_eff], axis=1, bitorder="little")
+        n_good = np.bitwise_count(packed.view(f"u{F_block // 8}")).astype(mask_dtype, copy=False)
+    else:
+        n_good = np.einsum("tbf->tb", good_v).astype(mask_dtype)
+    return good_v, n_good
+
+
 def _clean_with_good_mask(
     s1: np.ndarray,
     good: np.ndarray,
     F_block: int,
+    use_numba: bool = False,
+    weights: Optional[Tuple[np.ndarray, np.ndarray]] = None,
 ) -> Tuple[np.ndarray, np.ndarray, int, int]:
     """
     Given s1(T, F) and good(T, F) boolean mask (True for good channels),
     perform block-wise integration over frequency in chunks of F_block.
+    All arithmetic is float32 (s1 is cast if needed): S1 is a bounded
+    power sum averaged over a few channels, well within float32 range and
+    precision, and float32 halves the bytes moved. With use_numba (and
+    numba installed) the compiled kernel from _clean_kernel(F_block) is used;
+    otherwise weights, if given, is _block_weights(good, F_block).
 
     Returns:
         s1_clean (T, n_blocks),
-        mask_block (T, n_blocks) number of good channels per block (0..F_block),
+        mask_block (T, n_blocks) number of good channels per block (0..F_block)
+                   as uint8 (uint16 if F_block > 255, see _mask_dtype),
         F_eff (int) effective number of channels used,
         n_blocks (int)
     """
@@ -170,21 +363,32 @@ def _clean_with_good_mask(
             f"F={F} is smaller than F_block={F_block}; no full blocks can be formed."
         )
 
-    # Restrict to full blocks
-    s1_eff = s1[:, :F_eff]
-    good_eff = good[:, :F_eff]
+    kernel = _clean_kernel(F_block) if use_numba else None
+    if kernel is not None:
+        s1_clean = np.empty((T, n_blocks), dtype=np.float32)
+        mask_block = np.empty((T, n_blocks), dtype=_mask_dtype(F_block))
+        blocks = (T, n_blocks, F_block)
+        # The compiled loop may evaluate 0/0 for all-bad blocks before
+        # selecting NaN; silence the resulting floating-point warning.
+        with np.errstate(invalid="ignore"):
+            kernel(
+                s1[:, :F_eff].astype(np.float32, copy=False).reshape(blocks),
+                good[:, :F_eff].view(np.uint8).reshape(blocks),
+                out=(s1_clean, mask_block),
+            )
+        return s1_clean, mask_block, F_eff, n_blocks
 
-    # Convert good to float (1.0 for good, 0.0 for bad)
-    good_f = good_eff.astype(float)
+    # Restrict to full blocks, as (T, n_blocks, F_block) views
+    blocks = (T, n_blocks, F_block)
+    s1_v = s1[:, :F_eff].astype(np.float32, copy=False).reshape(blocks)
 
-    # Apply mask and reshape into blocks
-    s1_masked = s1_eff * good_f
-    s1_blk = s1_masked.reshape(T, n_blocks, F_block)
-    good_blk = good_f.reshape(T, n_blocks, F_block)
+    # Float32 good weights and good-channel counts; a mask shared by XX
+    # and YY ('or'/'and') is reduced once by the caller and passed in
+    good_v, n_good = weights if weights is not None else _block_weights(good, F_block)
 
-    # Sum of good samples and count of good channels per block
-    s1_sum = np.sum(s1_blk, axis=2)         # (T, n_blocks)
-    n_good = np.sum(good_blk, axis=2)       # (T, n_blocks)
+    # Sum of good samples per block; einsum fuses the mask multiply into
+    # the sum (no masked (T, F) temporary)
+    s1_sum = np.einsum("tbf,tbf->tb", s1_v, good_v)    # (T, n_blocks)
 
     # Average of good channels; avoid division by zero
     avg_good = np.zeros_like(s1_sum)
@@ -196,7 +400,7 @@ def _clean_with_good_mask(
     )
 
     # Flux-conserving approx: inflate average back to F_block channels
-    s1_clean = avg_good * float(F_block)
+    s1_clean = avg_good * np.float32(F_block)
 
     # Where n_good == 0, set s1_clean to NaN
     s1_clean[n_good == 0] = np.nan
@@ -208,18 +412,24 @@ def _clean_with_good_mask(
 
 
 def rfi_clean(
-    skfile: str,
+    skfile: str | h5py.File,
     F_block: int = 8,
     flag_mode: str = "separate",
     out_dir: str = ".",
+    num_threads: int = 0,
+    compression: Optional[str] = "lzf",
 ) -> str:
     """
     High-level RFI cleaning driver.
 
+    The input is processed in tiles of time rows (see _row_tile): each
+    tile of s1/flags is read, cleaned and written to the output before
+    the next one is read, so memory use does not grow with T.
+
     Parameters
     ----------
-    skfile : str
-        Path to SK-stream HDF5 file.
+    skfile : str or h5py.File
+        Path to SK-stream HDF5 file, or an open handle to it (left open).
     F_block : int
         Frequency block size used for integration (default 8).
     flag_mode : {'separate', 'or', 'and'}
@@ -229,126 +439,223 @@ def rfi_clean(
           - 'and'      : flagged_comb = flagged_xx AND flagged_yy
     out_dir : str
         Output directory. The filename is auto-generated.
+    num_threads : int
+        Threads for the numba kernel (large inputs only, see
+        NUMBA_MIN_SAMPLES); 0 (default) keeps numba's default.
+    compression : str or None
+        HDF5 compression for the (T, n_blocks) outputs, with byte shuffle:
+        'lzf' (default, built into h5py like the SK-stream products),
+        'gzip', 'zstd' (Blosc zstd level 3; needs hdf5plugin to write and
+        to read back), or None to disable.
 
     Returns
     -------
     out_path : str
         Path to the output HDF5 file.
     """
-    print(f"[INFO] RFI cleaning input: {skfile}")
+    print(f"[INFO] RFI cleaning input: {_h5_name(skfile)}")
     print(f"[INFO] F_block={F_block}, flag_mode={flag_mode}")
 
-    data = _load_skstream(skfile)
-    freq = data["freq_hz"]
-    time_blk = data["time_blk"]
-    has_xx = data["has_xx"]
-    has_yy = data["has_yy"]
-    attrs = data["attrs"]
-
-    M_stage1 = int(attrs.get("M", -1)) if "M" in attrs else None
-
-    # Prepare boolean good masks from SK flags
-    good_xx = None
-    good_yy = None
-
-    if has_xx:
-        flags_xx = data["flags_xx"]
-        good_xx = (flags_xx == 0)
-        print(f"[INFO] XX present: s1_xx shape={data['s1_xx'].shape}")
-
-    if has_yy:
-        flags_yy = data["flags_yy"]
-        good_yy = (flags_yy == 0)
-        print(f"[INFO] YY present: s1_yy shape={data['s1_yy'].shape}")
-
     # Combine masks according to flag_mode
     flag_mode = flag_mode.lower()
     if flag_mode not in ("separate", "or", "and"):
         raise ValueError("flag_mode must be one of: 'separate', 'or', 'and'.")
 
-    good_comb = None
-    if flag_mode in ("or", "and") and has_xx and has_yy:
-        # flagged booleans
-        fxx = (data["flags_xx"] != 0)
-        fyy = (data["flags_yy"] != 0)
-        if flag_mode == "or":
-            flagged_comb = fxx | fyy
-        else:  # 'and'
-            flagged_comb = fxx & fyy
-        good_comb = ~flagged_comb
-        print(f"[INFO] Using shared mask for XX/YY via '{flag_mode}' combination.")
-
-    # Clean XX and YY as available
-    s1_xx_clean = mask_xx_block = None
-    s1_yy_clean = mask_yy_block = None
-    F_eff = n_blocks = None
-
-    if has_xx:
-        s1_xx = data["s1_xx"]
-        good_for_xx = good_comb if good_comb is not None else good_xx
-        s1_xx_clean, mask_xx_block, F_eff_xx, n_blocks_xx = _clean_with_good_mask(
-            s1_xx, good_for_xx, F_block
-        )
-        F_eff = F_eff_xx
-        n_blocks = n_blocks_xx
-
-    if has_yy:
-        s1_yy = data["s1_yy"]
-        good_for_yy = good_comb if good_comb is not None else good_yy
-        s1_yy_clean, mask_yy_block, F_eff_yy, n_blocks_yy = _clean_with_good_mask(
-            s1_yy, good_for_yy, F_block
-        )
-        if F_eff is None:
-            F_eff = F_eff_yy
-            n_blocks = n_blocks_yy
-        else:
-            if (F_eff != F_eff_yy) or (n_blocks != n_blocks_yy):
-                raise RuntimeError(
-                    "Inconsistent F_eff or n_blocks between XX and YY cleaning."
-                )
-
-    if F_eff is None or n_blocks is None:
-        raise RuntimeError("No polarization was cleaned; nothing to write.")
-
-    print(f"[INFO] Effective F_eff={F_eff}, n_blocks={n_blocks}")
-
-    # Build block-averaged frequencies
-    freq_eff = freq[:F_eff]
-    freq_blk = freq_eff.reshape(n_blocks, F_block).mean(axis=1)
-
-    # Determine output path
-    os.makedirs(out_dir, exist_ok=True)
-    out_path = _build_output_path(skfile, out_dir, M_stage1, F_block, flag_mode)
-    print(f"[INFO] Output file: {out_path}")
-
-    # Write output HDF5
-    with h5py.File(out_path, "w") as g:
-        # Core datasets
-        g.create_dataset("time_blk", data=time_blk, compression="gzip")
-        g.create_dataset("freq_block_hz", data=freq_blk, compression="gzip")
-
-        if has_xx and s1_xx_clean is not None and mask_xx_block is not None:
-            g.create_dataset("s1_xx_clean", data=s1_xx_clean, compression="gzip")
-            g.create_dataset("mask_xx", data=mask_xx_block, compression="gzip")
+    with _open_h5(skfile) as f:
+        data = _load_skstream(f)
+        freq = data["freq_hz"]
+        time_blk = data["time_blk"]
+        has_xx = data["has_xx"]
+        has_yy = data["has_yy"]
+        attrs = data["attrs"]
+
+        M_stage1 = int(attrs.get("M", -1)) if "M" in attrs else None
+
+        pols = [p for p, has in (("xx", has_xx), ("yy", has_yy)) if has]
+        for p in pols:
+            print(f"[INFO] {p.upper()} present: s1_{p} shape={data['s1_' + p].shape}")
+
+        shapes = {data[f"{k}_{p}"].shape for p in pols for k in ("s1", "flags")}
+        if len(shapes) != 1:
+            raise ValueError(f"s1/flags datasets must all have the same shape, got {sorted(shapes)}.")
+        T, F = shapes.pop()
+
+        if F_block <= 0:
+            raise ValueError("F_block must be > 0.")
+        n_blocks = F // F_block
+        F_eff = n_blocks * F_block
+        if n_blocks == 0:
+            raise ValueError(
+                f"F={F} is smaller than F_block={F_block}; no full blocks can be formed."
+            )
+        mask_dtype = _mask_dtype(F_block)
+
+        shared = flag_mode in ("or", "and") and has_xx and has_yy
+        if shared:
+            print(f"[INFO] Using shared mask for XX/YY via '{flag_mode}' combination.")
+
+        print(f"[INFO] Effective F_eff={F_eff}, n_blocks={n_blocks}")
+
+        # Build block-averaged frequencies (float64 whatever the stored dtype)
+        freq_blk = freq[:F_eff].reshape(n_blocks, F_block).mean(axis=1, dtype=np.float64)
+
+        # Determine output path
+        os.makedirs(out_dir, exist_ok=True)
+        out_path = _build_output_path(_h5_name(skfile), out_dir, M_stage1, F_block, flag_mode)
+        print(f"[INFO] Output file: {out_path}")
+
+        # Tiles of t_step rows; output chunks are one tile high
+        t_step = _row_tile(data["s1_" + pols[0]], F * 4)
+        use_numba = T * F >= NUMBA_MIN_SAMPLES and T >= NUMBA_MIN_ROWS
+        if use_numba and num_threads > 0 and _clean_kernel(F_block) is not None:
+            _set_numba_threads(num_threads)
+
+        filters = _compression_filters(compression)
+
+        # Write output HDF5 (under a temporary name until complete)
+        with batch_common.atomic_output(out_path) as tmp_path, h5py.File(tmp_path, "w") as g:
+            # Core datasets
+            # Small 1-D axes are stored uncompressed
+            g.create_dataset("time_blk", data=time_blk)
+            g.create_dataset("freq_block_hz", data=freq_blk)
+
+            out = {}
+            for p in pols:
+                for name, dtype in ((f"s1_{p}_clean", np.float32), (f"mask_{p}", mask_dtype)):
+                    out[name] = g.create_dataset(
+                        name,
+                        shape=(T, n_blocks),
+                        dtype=dtype,
+                        chunks=(t_step, n_blocks),
+                        **filters,
+                    )
+
+            # Flags are read at their stored dtype (int8) and s1 as float32
+            # (HDF5 converts if stored otherwise) into reused tile buffers.
+            # There are two sets: a reader thread fills the next tile while
+            # this one is cleaned and written (h5py releases the GIL while
+            # HDF5 reads and decompresses).
+            tile_bufs = [
+                {
+                    p: (
+                        np.empty((t_step, F), dtype=data["flags_" + p].dtype),
+                        np.empty((t_step, F), dtype=np.float32),
+                    )
+                    for p in pols
+                }
+                for _ in range(2)
+            ]
+            good_buf = {p: np.empty((t_step, F), dtype=bool) for p in pols}
+
+            TileBufs = Dict[str, Tuple[np.ndarray, np.ndarray]]
+
+            def read_tile(t0: int, bufs: TileBufs) -> TileBufs:
+                """(flags, s1) views of rows t0:t0 + t_step per pol, read into bufs."""
+                t1 = min(t0 + t_step, T)
+                tile = {}
+                for p, (flags_buf, s1_buf) in bufs.items():
+                    data["flags_" + p].read_direct(flags_buf, np.s_[t0:t1], np.s_[: t1 - t0])
+                    data["s1_" + p].read_direct(s1_buf, np.s_[t0:t1], np.s_[: t1 - t0])
+                    tile[p] = (flags_buf[: t1 - t0], s1_buf[: t1 - t0])
+                return tile
+
+            # On multi-core hosts the numpy path cleans XX and YY of a tile
+            # concurrently (its reductions release the GIL); the numba
+            # kernel already runs on all threads by itself.
+            threaded = len(pols) == 2 and not use_numba and (os.cpu_count() or 1) > 1
+            pool = ThreadPoolExecutor(max_workers=2) if threaded else contextlib.nullcontext()
+
+            with ThreadPoolExecutor(max_workers=1) as reader, pool as ex:
+                starts = range(0, T, t_step)
+                pending = reader.submit(read_tile, 0, tile_bufs[0])
+                for i, t0 in enumerate(starts):
+                    tile = pending.result()
+                    if i + 1 < len(starts):
+                        pending = reader.submit(read_tile, starts[i + 1], tile_bufs[(i + 1) % 2])
+                    t1 = min(t0 + t_step, T)
+                    n = t1 - t0
+
+                    # Boolean good masks from SK flags for this tile
+                    good = {p: np.equal(tile[p][0], 0, out=good_buf[p][:n]) for p in pols}
+                    if shared:
+                        # Combine the good masks directly (De Morgan), in place:
+                        # flagged_xx OR flagged_yy  <=>  good_xx AND good_yy
+                        # flagged_xx AND flagged_yy <=>  good_xx OR good_yy
+                        combine = np.logical_and if flag_mode == "or" else np.logical_or
+                        good["xx"] = good["yy"] = combine(good["xx"], good["yy"], out=good["xx"])
+
+                    # Reduce a shared mask once for both pols (numpy path)
+                    weights = _block_weights(good["xx"], F_block) if shared and not use_numba else None
+
+                    # Clean XX and YY as available
+                    def clean(p: str) -> Tuple[np.ndarray, np.ndarray, int, int]:
+                        return _clean_with_good_mask(tile[p][1], good[p], F_block, use_numba, weights)
+
+                    cleaned = ex.map(clean, pols) if ex is not None else map(clean, pols)
+                    for p, (s1_clean, mask_block, _, _) in zip(pols, cleaned):
+                        out[f"s1_{p}_clean"][t0:t1] = s1_clean
+                        out[f"mask_{p}"][t0:t1] = mask_block
+
+            # Attributes: copy SK parameters, then add RFI-clean metadata
+            for key, val in attrs.items():
+                g.attrs[key] = val
+
+            if M_stage1 is not None and M_stage1 >= 0:
+                g.attrs["M_stage1"] = int(M_stage1)
+
+            g.attrs["F_block"] = int(F_block)
+            g.attrs["flag_mode"] = str(flag_mode)
+            g.attrs["F_eff"] = int(F_eff)
+            g.attrs["n_blocks"] = int(n_blocks)
 
-        if has_yy and s1_yy_clean is not None and mask_yy_block is not None:
-            g.create_dataset("s1_yy_clean", data=s1_yy_clean, compression="gzip")
-            g.create_dataset("mask_yy", data=mask_yy_block, compression="gzip")
+    print("[INFO] RFI cleaning complete.")
+    return out_path
 
-        # Attributes: copy SK parameters, then add RFI-clean metadata
-        for key, val in attrs.items():
-            g.attrs[key] = val
 
-        if M_stage1 is not None and M_stage1 >= 0:
-            g.attrs["M_stage1"] = int(M_stage1)
+def output_path(
+    skfile: str | h5py.File,
+    out_dir: str = ".",
+    F_block: int = 8,
+    flag_mode: str = "separate",
+) -> str:
+    """
+    Path rfi_clean() will write for these parameters. Only the root
+    attribute M is read from skfile (path or open handle); no datasets are
+    loaded.
+    """
+    with _open_h5(skfile) as f:
+        M_stage1 = f.attrs.get("M")
+    if M_stage1 is not None:
+        M_stage1 = int(M_stage1)
+    return _build_output_path(_h5_name(skfile), out_dir, M_stage1, F_block, flag_mode.lower())
 
-        g.attrs["F_block"] = int(F_block)
-        g.attrs["flag_mode"] = str(flag_mode)
-        g.attrs["F_eff"] = int(F_eff)
-        g.attrs["n_blocks"] = int(n_blocks)
 
-    print("[INFO] RFI cleaning complete.")
-    return out_path
+def run(
+    skfile: str | h5py.File,
+    *,
+    F_block: int = 8,
+    flag_mode: str = "separate",
+    out_dir: str = ".",
+    num_threads: int = 0,
+    compression: Optional[str] = "lzf",
+) -> str:
+    """
+    Programmatic equivalent of the CLI: validate the input path, run
+    rfi_clean, and return the output HDF5 path. Batch drivers call this
+    in-process instead of spawning a new interpreter per file, and may pass
+    an already-open h5py.File instead of a path.
+    """
+    if not isinstance(skfile, h5py.File) and not os.path.exists(skfile):
+        raise FileNotFoundError(skfile)
+
+    return rfi_clean(
+        skfile=skfile,
+        F_block=F_block,
+        flag_mode=flag_mode,
+        out_dir=out_dir,
+        num_threads=num_threads,
+        compression=compression,
+    )
 
 
 # ----------------------------------------------------------------------
@@ -363,9 +670,11 @@ def main() -> None:
         )
     )
     ap.add_argument(
-        "skfile",
+        "skfiles",
+        metavar="skfile",
         type=str,
-        help="Input SK-stream HDF5 file (e.g. *_skstream.h5).",
+        nargs="+",
+        help="Input SK-stream HDF5 file(s) (e.g. *_skstream.h5).",
     )
     ap.add_argument(
         "--F-block",
@@ -390,17 +699,37 @@ def main() -> None:
         default=".",
         help="Output directory for the cleaned HDF5 file (default: current directory).",
     )
+    ap.add_argument(
+        "--compression",
+        choices=["lzf", "gzip", "zstd", "none"],
+        default="lzf",
+        help=(
+            "HDF5 compression for the cleaned outputs (default: lzf; "
+            "zstd needs hdf5plugin to write and read)."
+        ),
+    )
+    ap.add_argument(
+        "--num-threads",
+        type=int,
+        default=0,
+        help=(
+            "Threads for the numba cleaning kernel on large inputs "
+            "(default: 0 = numba's default, all CPUs)."
+        ),
+    )
 
     args = ap.parse_args()
 
-    if not os.path.exists(args.skfile):
-        raise FileNotFoundError(args.skfile)
-
-    rfi_clean(
-        skfile=args.skfile,
-        F_block=args.F_block,
-        flag_mode=args.flag_mode,
-        out_dir=args.out_dir,
+    batch_common.run_each_input(
+        args.skfiles,
+        functools.partial(
+            run,
+            F_block=args.F_block,
+            flag_mode=args.flag_mode,
+            out_dir=args.out_dir,
+            num_threads=args.num_threads,
+            compression=None if args.compression == "none" else args.compression,
+        ),
     )
 
 
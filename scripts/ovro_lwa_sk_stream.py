@@ -35,49 +35,93 @@ and file-level attributes:
 
     - "M", "N", "d", "pfa"
     - "ns_total", "ns_start", "ns_eff", "nfreq"
+    - "ns_max" (only when --ns-max was given)
     - a description string.
 
 A tqdm progress bar is used if available; otherwise, the script falls back
-to occasional text progress messages.
+to occasional text progress messages. For large inputs (NUMBA_MIN_SAMPLES)
+the per-block S1/S2 sums run in a numba kernel if numba is installed
+(compiled once, cached next to this script); otherwise numpy is used.
+Both give the same sums. With --workers > 1 the sums for batches of
+blocks are computed in a process pool; the output is unchanged.
 """
 
 from __future__ import annotations
 
 import argparse
+import collections
+import contextlib
+import functools
+import mmap
+import multiprocessing
 import os
-from typing import Optional, Tuple
+import sys
+import warnings
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
 
 import numpy as np
 import h5py
 
-import pygsk.core as core
 from pygsk.thresholds import compute_sk_thresholds
 
+import ovro_lwa_batch_common as batch_common
+
+# Target size of one s1_* output chunk. Output chunks span this many bytes
+# of float32 rows (at least one block, at most all of them), and blocks are
+# processed in batches of exactly one chunk row, so every batch write fills
+# whole chunks.
+OUT_CHUNK_BYTES = 1 << 20
+
+# Target size of one raw read per polarization. Each h5py call reads a
+# stripe of this many bytes' worth of whole blocks, which are then
+# processed from RAM, instead of one call per block.
+READ_STRIPE_BYTES = 1 << 23
+
 # Optional tqdm for progress bar
 try:
     from tqdm import tqdm  # type: ignore
 except Exception:  # ImportError or anything else weird
     tqdm = None
 
+# Inputs with at least this many samples per polarization use the numba
+# S1/S2 kernel, if numba is installed. Below it, importing numba and
+# loading the cached kernel (~0.35 s) costs more than the kernel saves.
+NUMBA_MIN_SAMPLES = 1 << 27
+
+# The time axis is checked for uniform cadence at this many evenly spaced
+# samples, each allowed to deviate from t0 + i*dt by TIME_UNIFORM_TOL * dt.
+TIME_CHECK_SAMPLES = 17
+TIME_UNIFORM_TOL = 1e-3
+
 
 # ----------------------------------------------------------------------
 # Helpers
 # ----------------------------------------------------------------------
-def _load_time_array(ds_time: h5py.Dataset, ns_total: int) -> np.ndarray:
+def _to_seconds(t: np.ndarray) -> np.ndarray:
     """
-    Load time dataset as a 1-D float array (seconds since epoch, or numeric),
-    handling both numeric and ISO-string representations.
+    Convert time values read from the 'time' dataset to a float array
+    (seconds since epoch, or numeric), handling both numeric and
+    ISO-string representations.
     """
-    t = ds_time[:]
-    if t.ndim != 1 or t.shape[0] != ns_total:
-        raise ValueError(
-            f"'time' dataset must be 1-D with length {ns_total}, got shape {t.shape}"
-        )
-
     if np.issubdtype(t.dtype, np.number):
         return np.asarray(t, dtype=float)
 
-    # Assume string-like; parse ISO timestamps to UNIX seconds
+    # Assume string-like; parse ISO timestamps to UNIX seconds.
+    # Fast path: numpy parses naive / 'Z' (UTC) ISO timestamps in C, and
+    # fastest straight from fixed-length bytes as h5py returns them. Other
+    # UTC offsets make numpy warn, and some spellings it rejects; those go
+    # through datetime.fromisoformat below.
+    t_fix = t if t.dtype.kind in "SU" else np.array(t, dtype=str)
+    z = b"Z" if t_fix.dtype.kind == "S" else "Z"
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            us = np.char.rstrip(t_fix, z).astype("datetime64[us]").astype(np.int64)
+        return us / 1e6
+    except (ValueError, UserWarning, DeprecationWarning):
+        pass
+
     t_str = np.array(t, dtype=str)
 
     from datetime import datetime, timezone
@@ -93,27 +137,115 @@ def _load_time_array(ds_time: h5py.Dataset, ns_total: int) -> np.ndarray:
             dt = dt.astimezone(timezone.utc)
         return dt.timestamp()
 
-    return np.array([_parse_iso_to_unix(s) for s in t_str], dtype=float)
+    return np.array([_parse_iso_to_unix(s) for s in t_str.ravel()], dtype=float).reshape(t_str.shape)
+
+
+def _load_time_array(ds_time: h5py.Dataset, ns_total: int) -> np.ndarray:
+    """
+    Load time dataset as a 1-D float array (seconds since epoch, or numeric),
+    handling both numeric and ISO-string representations.
+    """
+    t = ds_time[:]
+    if t.ndim != 1 or t.shape[0] != ns_total:
+        raise ValueError(
+            f"'time' dataset must be 1-D with length {ns_total}, got shape {t.shape}"
+        )
+    return _to_seconds(t)
+
+
+def _time_axis(
+    ds_time: h5py.Dataset,
+    ns_total: int,
+) -> Tuple[float, float, Optional[np.ndarray]]:
+    """
+    Describe the time dataset as (t0, dt, time).
+
+    Only TIME_CHECK_SAMPLES evenly spaced entries (first and last
+    included) are read: t0 = time[0], dt = (time[-1] - time[0]) / (ns - 1).
+    If every sample lies within TIME_UNIFORM_TOL * dt of t0 + i * dt, the
+    cadence is taken as uniform and time is None; block centers then
+    follow arithmetically. Otherwise the full array is loaded and
+    returned as time.
+    """
+    if ds_time.ndim != 1 or ds_time.shape[0] != ns_total:
+        raise ValueError(
+            f"'time' dataset must be 1-D with length {ns_total}, got shape {ds_time.shape}"
+        )
+
+    idx = np.unique(np.linspace(0, ns_total - 1, TIME_CHECK_SAMPLES).round().astype(np.int64))
+    t = _to_seconds(ds_time[idx])
+    t0 = float(t[0])
+    dt = float(t[-1] - t0) / (ns_total - 1) if ns_total > 1 else 0.0
+
+    resid = np.abs(t - (t0 + idx * dt))
+    if np.isfinite(dt) and np.all(resid <= TIME_UNIFORM_TOL * abs(dt)):
+        return t0, dt, None
+
+    print("[INFO] 'time' is not uniformly sampled; loading the full time array.")
+    return t0, dt, _load_time_array(ds_time, ns_total)
+
+
+def _chunk_cache_bytes(ds: h5py.Dataset, M: int) -> int:
+    """
+    Chunk-cache size (bytes) that holds every chunk a read of M
+    consecutive rows of ds can touch: all chunks across frequency, for as
+    many chunk rows as the read can straddle. 0 for contiguous datasets.
+    """
+    if ds.chunks is None:
+        return 0
+    ct, cf = ds.chunks
+    nf = ds.shape[1]
+    chunk_rows = -(-(M - 1) // ct) + 1
+    return chunk_rows * -(-nf // cf) * ct * cf * ds.dtype.itemsize
 
 
 def _open_datasets(
     h5_path: str,
-) -> Tuple[h5py.File, h5py.Dataset, h5py.Dataset, np.ndarray, np.ndarray]:
+    M: Optional[int] = None,
+    verbose: bool = True,
+) -> Tuple[
+    h5py.File, h5py.Dataset, h5py.Dataset, np.ndarray,
+    Tuple[float, float, Optional[np.ndarray]],
+]:
     """
     Open OVRO-LWA HDF5 file and return:
 
-        fin     : open h5py.File (caller must close)
-        ds_xx   : dataset for XX power, shape (ns, nf)
-        ds_yy   : dataset for YY power, shape (ns, nf)
-        freq    : (nf,) float64 array in Hz
-        time    : (ns,) float64 array (seconds since epoch, or numeric)
+        fin       : open h5py.File (caller must close)
+        ds_xx     : dataset for XX power, shape (ns, nf)
+        ds_yy     : dataset for YY power, shape (ns, nf)
+        freq      : (nf,) float64 array in Hz
+        time_axis : (t0, dt, time), see _time_axis; time is the full
+                    (ns,) float64 array only for non-uniform cadence
 
     If the 'time' dataset is missing, a synthetic time axis equal to
-    np.arange(ns, dtype=float) is used.
+    np.arange(ns, dtype=float) is used (t0=0, dt=1).
+
+    With M given, the file is reopened with a larger chunk cache when the
+    default one cannot hold the chunks of one M-row block (see
+    _chunk_cache_bytes). Otherwise each chunk would be evicted before the
+    next block reads the rest of it, and decompressed over and over.
+    verbose=False silences the [INFO]/[WARN] messages (pool workers).
     """
     fin = h5py.File(h5_path, "r")
     group = "Observation1/Tuning1"
 
+    if M is not None:
+        ds = fin[f"{group}/XX"]
+        need = _chunk_cache_bytes(ds, M)
+        if need > ds.id.get_access_plist().get_chunk_cache()[1]:
+            n_chunks = need // (ds.chunks[0] * ds.chunks[1] * ds.dtype.itemsize)
+            fin.close()
+            if verbose:
+                print(f"[INFO] Using a {need / 2**20:.1f} MiB chunk cache per dataset.")
+            # ~100 hash slots per cached chunk; w0=1 evicts fully read chunks first
+            fin = h5py.File(
+                h5_path,
+                "r",
+                rdcc_nbytes=need,
+                rdcc_nslots=max(521, 100 * n_chunks) | 1,
+                rdcc_w0=1.0,
+            )
+
     ds_xx = fin[f"{group}/XX"]
     ds_yy = fin[f"{group}/YY"]
     ds_freq = fin[f"{group}/freq"]
@@ -139,17 +271,313 @@ def _open_datasets(
     # Time (expected for time_blk) – but tolerate missing dataset
     time_path = f"{group}/time"
     if time_path in fin:
-        ds_time = fin[time_path]
-        time = _load_time_array(ds_time, ns_total=ns_total)
+        time_axis = _time_axis(fin[time_path], ns_total=ns_total)
     else:
-        print(
-            f"[WARN] Dataset '{time_path}' not found in {h5_path}; "
-            "using synthetic time axis (0, 1, 2, ...)."
-        )
-        time = np.arange(ns_total, dtype=float)
+        if verbose:
+            print(
+                f"[WARN] Dataset '{time_path}' not found in {h5_path}; "
+                "using synthetic time axis (0, 1, 2, ...)."
+            )
+        time_axis = (0.0, 1.0, None)
+
+    return fin, ds_xx, ds_yy, freq, time_axis
+
+
+def _mmap_dataset(f: h5py.File, ds: h5py.Dataset) -> Optional[np.ndarray]:
+    """
+    Read-only (ns, nf) view of ds straight from a memory map of the file,
+    if its raw bytes can be used as is: a contiguous, unfiltered,
+    already-allocated dataset in a plain (sec2, no user block) file.
+    None otherwise.
+    """
+    if ds.chunks is not None or ds.compression is not None or f.driver != "sec2" or f.userblock_size:
+        return None
+    offset = ds.id.get_offset()
+    if offset is None:
+        return None
+    with open(f.filename, "rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(mm, dtype=ds.dtype, count=ds.size, offset=offset).reshape(ds.shape)
+
+
+@functools.lru_cache(maxsize=None)
+def _block_sums_kernel() -> Optional[Callable[[np.ndarray, np.ndarray, np.ndarray], None]]:
+    """
+    Compiled kernel(block, s1, s2) setting s1[f] = sum_i block[i, f] and
+    s2[f] = sum_i block[i, f]**2 in float64, in one row-major pass over a
+    block of any native numeric dtype. None if numba is not available.
+    Sums are added in the same order as numpy's axis-0 reduction.
+    It releases the GIL, so the stripe reader thread runs alongside it.
+    """
+    try:
+        from numba import njit  # type: ignore
+    except Exception:
+        return None
+
+    @njit(cache=True, nogil=True)
+    def _block_sums(block, s1, s2):
+        M, nf = block.shape
+        for f in range(nf):
+            s1[f] = 0.0
+            s2[f] = 0.0
+        for i in range(M):
+            for f in range(nf):
+                x = np.float64(block[i, f])
+                s1[f] += x
+                s2[f] += x * x
+
+    return _block_sums
+
+
+class _BlockSums:
+    """
+    S1/S2 of runs of consecutive M-row blocks of XX and YY from an open
+    file. Buffers, memory maps and the numba kernel (use_numba, if
+    installed) are set up once; calling sums(i0, n, s1, s2) then fills
+    s1[:, :n] and s2[:, :n] ((2, >=n, nf) float64, XX then YY) for the n
+    blocks starting at row i0.
+
+    Raw reads land in stripe buffers of the stored dtype (no per-read
+    h5py allocation) covering S blocks (~READ_STRIPE_BYTES per pol).
+    There are two sets: on multi-core hosts a reader thread fills the
+    next stripe while the blocks of this one are summed (h5py releases
+    the GIL while HDF5 reads and decompresses; on one core there is
+    nothing to overlap and the thread only adds hand-offs). Passing
+    next_run=(i0, n) of the following call also reads its first stripe
+    ahead. close() stops the reader.
+    Uncompressed contiguous inputs are memory mapped instead, and blocks
+    are views of the mapped file. With numba, S1/S2 are summed straight
+    from the stored dtype in one row-major pass (float64 accumulators);
+    otherwise einsum sums the block in float64 (see block_xx below).
+    """
+
+    def __init__(
+        self,
+        fin: h5py.File,
+        ds_xx: h5py.Dataset,
+        ds_yy: h5py.Dataset,
+        M: int,
+        use_numba: bool,
+    ) -> None:
+        nf = ds_xx.shape[1]
+        self.ds_xx = ds_xx
+        self.ds_yy = ds_yy
+        self.M = M
+
+        self.mm_xx = _mmap_dataset(fin, ds_xx)
+        self.mm_yy = _mmap_dataset(fin, ds_yy)
+        self.mapped = self.mm_xx is not None and self.mm_yy is not None
+        if not self.mapped:
+            self.S = max(1, READ_STRIPE_BYTES // (M * nf * ds_xx.dtype.itemsize))
+            self.raw = [
+                (
+                    np.empty((self.S * M, nf), dtype=ds_xx.dtype),
+                    np.empty((self.S * M, nf), dtype=ds_yy.dtype),
+                )
+                for _ in range(2)
+            ]
+            self.slot = 0
+            self.reader = ThreadPoolExecutor(max_workers=1) if (os.cpu_count() or 1) > 1 else None
+            # (stripe, future) read ahead for the next call, if any
+            self.ahead: Optional[Tuple[Tuple[int, int], Future]] = None
+
+        self.kernel = None
+        if use_numba and ds_xx.dtype.isnative and ds_yy.dtype.isnative:
+            self.kernel = _block_sums_kernel()
+        if self.kernel is None:
+            # float64 blocks are summed as they are. Narrower dtypes are widened
+            # with one copy into a reused buffer, which is faster than letting
+            # einsum cast (dtype=np.float64) through its internal buffers.
+            self.block_xx = None if ds_xx.dtype == np.float64 else np.empty((M, nf), dtype=np.float64)
+            self.block_yy = None if ds_yy.dtype == np.float64 else np.empty((M, nf), dtype=np.float64)
+
+    def close(self) -> None:
+        """Wait for any read in flight and stop the reader thread."""
+        if not self.mapped and self.reader is not None:
+            self.reader.shutdown(wait=True)
+
+    def _stripes(self, i0: int, n: int) -> List[Tuple[int, int]]:
+        """(first row, number of blocks) of the stripes covering n blocks from row i0."""
+        return [(i0 + j0 * self.M, min(self.S, n - j0)) for j0 in range(0, n, self.S)]
+
+    def _read(
+        self, r0: int, nb: int, bufs: Tuple[np.ndarray, np.ndarray]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Read nb blocks of XX and YY from row r0 into bufs."""
+        rows = nb * self.M
+        self.ds_xx.read_direct(bufs[0], np.s_[r0:r0 + rows, :], np.s_[:rows])
+        self.ds_yy.read_direct(bufs[1], np.s_[r0:r0 + rows, :], np.s_[:rows])
+        return bufs
+
+    def _submit(self, stripe: Tuple[int, int]) -> Future:
+        """Queue the read of stripe into the buffer set not in use."""
+        bufs = self.raw[self.slot]
+        self.slot ^= 1
+        if self.reader is not None:
+            return self.reader.submit(self._read, *stripe, bufs)
+        done: Future = Future()
+        done.set_result(self._read(*stripe, bufs))
+        return done
+
+    def __call__(
+        self,
+        i0: int,
+        n: int,
+        s1: np.ndarray,
+        s2: np.ndarray,
+        next_run: Optional[Tuple[int, int]] = None,
+    ) -> None:
+        M = self.M
+        if self.mapped:
+            self._sum_blocks(self.mm_xx[i0:i0 + n * M], self.mm_yy[i0:i0 + n * M], n, s1, s2, 0)
+            return
+
+        stripes = self._stripes(i0, n)
+        ahead, self.ahead = self.ahead, None
+        if ahead is not None and ahead[0] == stripes[0]:
+            pending = ahead[1]
+        else:
+            # Nothing (or another stripe) was read ahead. The reader runs
+            # reads in order, so a stale one is done before its buffer is
+            # filled again.
+            pending = self._submit(stripes[0])
+
+        b = 0
+        for k, (_r0, nb) in enumerate(stripes):
+            raw_xx, raw_yy = pending.result()
+            # Read the next stripe into the other buffers while this one is summed
+            if k + 1 < len(stripes):
+                pending = self._submit(stripes[k + 1])
+            elif next_run is not None:
+                first = self._stripes(*next_run)[0]
+                self.ahead = (first, self._submit(first))
+            self._sum_blocks(raw_xx, raw_yy, nb, s1, s2, b)
+            b += nb
+
+    def _sum_blocks(
+        self,
+        raw_xx: np.ndarray,
+        raw_yy: np.ndarray,
+        nb: int,
+        s1: np.ndarray,
+        s2: np.ndarray,
+        b: int,
+    ) -> None:
+        """S1/S2 of the first nb blocks of raw_xx/raw_yy into s1/s2[:, b:b + nb]."""
+        M = self.M
+        for j in range(b, b + nb):
+            # This block's (M, nf) rows of the stripe or map (views, no copy)
+            blk_xx = raw_xx[(j - b) * M:(j - b + 1) * M]
+            blk_yy = raw_yy[(j - b) * M:(j - b + 1) * M]
+
+            if self.kernel is not None:
+                self.kernel(blk_xx, s1[0, j], s2[0, j])
+                self.kernel(blk_yy, s1[1, j], s2[1, j])
+            else:
+                # einsum fuses the square into the sum, so S2 needs no (M, nf)
+                # temporary and one pass over the float64 block.
+                if self.block_xx is not None:
+                    np.copyto(self.block_xx, blk_xx)
+                    blk_xx = self.block_xx
+                if self.block_yy is not None:
+                    np.copyto(self.block_yy, blk_yy)
+                    blk_yy = self.block_yy
+                np.einsum("ij->j", blk_xx, out=s1[0, j])
+                np.einsum("ij->j", blk_yy, out=s1[1, j])
+                np.einsum("ij,ij->j", blk_xx, blk_xx, out=s2[0, j])
+                np.einsum("ij,ij->j", blk_yy, blk_yy, out=s2[1, j])
+
+
+# Per-process state of pool workers (see _worker_init)
+_WORKER_SUMS: Optional[_BlockSums] = None
+
+
+def _worker_init(h5_path: str, M: int, use_numba: bool) -> None:
+    """Pool initializer: open the input once per worker process."""
+    global _WORKER_SUMS
+    fin, ds_xx, ds_yy, _freq, _time = _open_datasets(h5_path, M, verbose=False)
+    _WORKER_SUMS = _BlockSums(fin, ds_xx, ds_yy, M, use_numba)
+
+
+def _worker_sums(i0: int, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Pool task: (s1, s2), each (2, n, nf), for n blocks from row i0."""
+    nf = _WORKER_SUMS.ds_xx.shape[1]
+    s1 = np.empty((2, n, nf), dtype=np.float64)
+    s2 = np.empty((2, n, nf), dtype=np.float64)
+    _WORKER_SUMS(i0, n, s1, s2)
+    return s1, s2
+
+
+def _mp_context() -> multiprocessing.context.BaseContext:
+    """
+    forkserver context preloading this module (as in the batch
+    pipeline), so workers neither re-import numpy/h5py/pygsk nor fork
+    the parent's open HDF5 handles. Platform default where unavailable.
+
+    __main__ is not preloaded: the workers only need this module, and
+    run() may be called from a script read from stdin, which the server
+    cannot import. Such a __main__ cannot be re-run by forkserver/spawn
+    children either, so workers are then forked from this process.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    main_path = getattr(sys.modules["__main__"], "__file__", None)
+    if main_path is not None and not os.path.isfile(main_path):
+        return multiprocessing.get_context("fork")
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["ovro_lwa_sk_stream"])
+    return ctx
+
+
+def _sk_coeff(M: int, N: int, d: float) -> np.float64:
+    """
+    The (M, N, d) prefactor of the generalized SK estimator,
+    (M*N*d + 1) / (M - 1), computed once per run (see _sk_into).
+    """
+    if M <= 0 or N <= 0:
+        raise ValueError("M and N must be > 0.")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (np.float64(M) * np.float64(N) * np.float64(d) + 1.0) / (np.float64(M) - 1.0)
+
+
+def _sk_into(
+    s1: np.ndarray,
+    s2: np.ndarray,
+    M: int,
+    coeff: np.float64,
+    out: np.ndarray,
+    tmp: np.ndarray,
+) -> np.ndarray:
+    """
+    SK estimator coeff * (M * s2 / s1**2 - 1) into out, with non-finite
+    values set to 0: the same values as pygsk.core.get_sk(s1, s2, M, N=N,
+    d=d) for coeff = _sk_coeff(M, N, d), but without re-validating the
+    parameters per call or allocating temporaries. tmp is a float64
+    scratch array of the same shape.
+    """
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        np.multiply(s2, np.float64(M), out=out)
+        np.square(s1, out=tmp)
+        np.divide(out, tmp, out=out)
+        np.subtract(out, 1.0, out=out)
+        np.multiply(out, coeff, out=out)
+    out[~np.isfinite(out)] = 0.0
+    return out
 
-    return fin, ds_xx, ds_yy, freq, time
 
+def _sk_flags(sk: np.ndarray, lower: float, upper: float, out: np.ndarray) -> np.ndarray:
+    """
+    SK flags into the int8 array out: +1 where sk > upper, -1 where
+    sk < lower, 0 elsewhere. Computed as (sk > upper) - (sk < lower) on
+    the boolean bytes, i.e. two compares and a subtract with no masked
+    scatter writes.
+    """
+    np.subtract(
+        np.greater(sk, upper).view(np.int8),
+        np.less(sk, lower).view(np.int8),
+        out=out,
+    )
+    return out
 
 
 # ----------------------------------------------------------------------
@@ -165,7 +593,8 @@ def stream_sk_dualpol(
     pfa: float = 1e-3,
     start_idx: int = 0,
     ns_max: Optional[int] = None,
-    compression: str = "gzip",
+    compression: Optional[str] = "lzf",
+    workers: int = 1,
 ) -> None:
     """
     Streaming SK "spectrometer" pipeline for BOTH polarizations (XX and YY).
@@ -185,6 +614,8 @@ def stream_sk_dualpol(
         Output HDF5 file to write (will be overwritten if exists).
     M : int
         Number of spectra per non-overlapping SK block (default: 64).
+        Reads are cheapest when M is a multiple or a divisor of the time
+        extent of the input's HDF5 chunks.
     N : int
         Gamma shape parameter N used in SK theory (default: 24).
     d : float
@@ -198,12 +629,19 @@ def stream_sk_dualpol(
         If None, process until end of dataset.
     compression : str
         HDF5 compression filter for s1_xx/s1_yy/sk_flags_* datasets
-        (e.g. 'gzip', 'lzf', or None to disable).
+        (e.g. 'gzip', 'lzf', or None to disable). Default 'lzf': it ships
+        with h5py, so any h5py reader can open the product, and it writes
+        and reads faster than gzip for only slightly larger files.
+    workers : int
+        Number of worker processes summing S1/S2 (default: 1, i.e. in this
+        process). Each worker opens the input itself and handles whole
+        batches of blocks; SK, flags and all writes stay in this process,
+        so the output does not depend on the worker count.
     """
     print(f"[INFO] Input HDF5: {h5_path}")
     print(f"[INFO] SK parameters: M={M}, N={N}, d={d}, pfa={pfa}")
 
-    fin, ds_xx, ds_yy, freq, time = _open_datasets(h5_path)
+    fin, ds_xx, ds_yy, freq, (t0, dt, time) = _open_datasets(h5_path, M)
     ns_total, nf = ds_xx.shape
     print(f"[INFO] Raw shape: ns={ns_total}, nf={nf}")
 
@@ -249,153 +687,247 @@ def stream_sk_dualpol(
     lower, upper, _ = compute_sk_thresholds(M, N=N, d=d, pfa=pfa)
     print(f"[INFO] SK thresholds: lower={lower:.6g}, upper={upper:.6g}")
 
-    # Prepare output file
+    # Prepare output file; it replaces an existing one only once complete
     if os.path.exists(out_path):
         print(f"[WARN] Overwriting existing output file: {out_path}")
-        os.remove(out_path)
 
-    fout = h5py.File(out_path, "w")
+    with fin, batch_common.atomic_output(out_path) as tmp_path, h5py.File(tmp_path, "w") as fout:
+        # Blocks per output chunk (and per processing batch), ~OUT_CHUNK_BYTES of s1
+        B = max(1, min(T, OUT_CHUNK_BYTES // (4 * nf)))
+
+        # Datasets: S1 for both pols, flags for both, freq and time_blk
+        dset_s1_xx = fout.create_dataset(
+            "s1_xx",
+            shape=(T, nf),
+            dtype="float32",
+            chunks=(B, nf),
+            compression=compression,
+            shuffle=True if compression is not None else False,
+        )
 
-    # Datasets: S1 for both pols, flags for both, freq and time_blk
-    dset_s1_xx = fout.create_dataset(
-        "s1_xx",
-        shape=(T, nf),
-        dtype="float32",
-        chunks=(1, nf),
-        compression=compression,
-        shuffle=True if compression is not None else False,
-    )
+        dset_s1_yy = fout.create_dataset(
+            "s1_yy",
+            shape=(T, nf),
+            dtype="float32",
+            chunks=(B, nf),
+            compression=compression,
+            shuffle=True if compression is not None else False,
+        )
 
-    dset_s1_yy = fout.create_dataset(
-        "s1_yy",
-        shape=(T, nf),
-        dtype="float32",
-        chunks=(1, nf),
-        compression=compression,
-        shuffle=True if compression is not None else False,
-    )
+        dset_flags_xx = fout.create_dataset(
+            "sk_flags_xx",
+            shape=(T, nf),
+            dtype="int8",
+            chunks=(B, nf),
+            compression=compression,
+            shuffle=True if compression is not None else False,
+        )
 
-    dset_flags_xx = fout.create_dataset(
-        "sk_flags_xx",
-        shape=(T, nf),
-        dtype="int8",
-        chunks=(1, nf),
-        compression=compression,
-        shuffle=True if compression is not None else False,
-    )
+        dset_flags_yy = fout.create_dataset(
+            "sk_flags_yy",
+            shape=(T, nf),
+            dtype="int8",
+            chunks=(B, nf),
+            compression=compression,
+            shuffle=True if compression is not None else False,
+        )
 
-    dset_flags_yy = fout.create_dataset(
-        "sk_flags_yy",
-        shape=(T, nf),
-        dtype="int8",
-        chunks=(1, nf),
-        compression=compression,
-        shuffle=True if compression is not None else False,
-    )
+        dset_freq = fout.create_dataset(
+            "freq_hz",
+            data=freq.astype("float64"),
+            dtype="float64",
+        )
 
-    dset_freq = fout.create_dataset(
-        "freq_hz",
-        data=freq.astype("float64"),
-        dtype="float64",
-    )
+        dset_time_blk = fout.create_dataset(
+            "time_blk",
+            shape=(T,),
+            dtype="float64",
+        )
 
-    dset_time_blk = fout.create_dataset(
-        "time_blk",
-        shape=(T,),
-        dtype="float64",
-    )
+        # File-level metadata
+        fout.attrs["input_file"] = os.path.abspath(h5_path)
+        fout.attrs["M"] = int(M)
+        fout.attrs["N"] = int(N)
+        fout.attrs["d"] = float(d)
+        fout.attrs["pfa"] = float(pfa)
+        fout.attrs["ns_total"] = int(ns_total)
+        fout.attrs["ns_start"] = int(start_idx)
+        fout.attrs["ns_eff"] = int(ns_eff)
+        if ns_max is not None:
+            fout.attrs["ns_max"] = int(ns_max)
+        fout.attrs["nfreq"] = int(nf)
+        fout.attrs["description"] = (
+            "Streaming SK spectrometer product: s1_xx(t,f), s1_yy(t,f), "
+            "and SK flags for XX and YY (sk_flags_xx, sk_flags_yy) computed "
+            "from non-overlapping blocks of M spectra. "
+            "time_blk is the block-center time derived from the original time array."
+        )
+
+        print("[INFO] Starting streaming SK computation (XX and YY, flags for both)...")
+
+        # Progress bar with tqdm on a terminal. Otherwise (no tqdm, or stderr
+        # is a pipe or a batch driver's log, where every bar refresh would
+        # become a line) occasional text messages.
+        pbar = None
+        if tqdm is not None and sys.stderr.isatty():
+            pbar = tqdm(total=T, desc="SK blocks", unit="block")
+
+        use_numba = ns_eff * nf >= NUMBA_MIN_SAMPLES
+
+        # Per-block sums are collected for B blocks (one output chunk row); SK,
+        # flags and the output writes then run once per batch, not per block.
+        # XX and YY share (2, B, nf) buffers so that one SK call and one flag
+        # pass cover both pols.
+        s1 = np.empty((2, B, nf), dtype=np.float64)
+        s2 = np.empty((2, B, nf), dtype=np.float64)
+        flags = np.empty((2, B, nf), dtype=np.int8)
+        sk = np.empty((2, B, nf), dtype=np.float64)
+        sk_tmp = np.empty((2, B, nf), dtype=np.float64)
+        sk_coeff = _sk_coeff(M, N, d)
+        batches = [(k0, min(B, T - k0)) for k0 in range(0, T, B)]
+
+        def _batch_results():
+            """Yield (k0, n, s1, s2) per batch, in order."""
+            if workers <= 1:
+                with contextlib.closing(_BlockSums(fin, ds_xx, ds_yy, M, use_numba)) as sums:
+                    for j, (k0, n) in enumerate(batches):
+                        # Also prefetch the first stripe of the next batch
+                        nxt = batches[j + 1] if j + 1 < len(batches) else None
+                        next_run = None if nxt is None else (start_idx + nxt[0] * M, nxt[1])
+                        sums(start_idx + k0 * M, n, s1, s2, next_run)
+                        yield k0, n, s1, s2
+                return
+
+            # Workers sum whole batches; at most 2 batches per worker are in
+            # flight, which bounds the memory held by finished results.
+            print(f"[INFO] Summing blocks in {workers} worker processes.")
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=_mp_context(),
+                initializer=_worker_init,
+                initargs=(h5_path, M, use_numba),
+            ) as pool:
+                pending = collections.deque()
+                for k0, n in batches:
+                    pending.append((k0, n, pool.submit(_worker_sums, start_idx + k0 * M, n)))
+                    if len(pending) >= 2 * workers:
+                        k0_, n_, fut = pending.popleft()
+                        yield (k0_, n_, *fut.result())
+                while pending:
+                    k0_, n_, fut = pending.popleft()
+                    yield (k0_, n_, *fut.result())
+
+        done = 0
+        # Closed before the input file, which stops the serial read-ahead
+        with contextlib.closing(_batch_results()) as results:
+            for k0, n, s1_b, s2_b in results:
+                k1 = k0 + n
+
+                # Block-center times: the mean of time[i0:i1] per block, which for
+                # uniform cadence is t0 + (i0 + (M-1)/2) * dt
+                i0 = start_idx + k0 * M
+                if time is None:
+                    t_blk = t0 + (i0 + np.arange(n) * M + (M - 1) / 2.0) * dt
+                else:
+                    t_blk = np.mean(time[i0:i0 + n * M].reshape(n, M), axis=1)
+
+                # SK for XX and YY over the whole batch in one call, shape (2, n, nf)
+                _sk_into(s1_b[:, :n], s2_b[:, :n], M, sk_coeff, out=sk[:, :n], tmp=sk_tmp[:, :n])
+
+                # Flags from SK for both pols
+                _sk_flags(sk[:, :n], lower, upper, out=flags[:, :n])
+
+                # Store results (S1 as float32, flags as int8)
+                dset_s1_xx[k0:k1, :] = s1_b[0, :n].astype("float32")
+                dset_s1_yy[k0:k1, :] = s1_b[1, :n].astype("float32")
+                dset_flags_xx[k0:k1, :] = flags[0, :n]
+                dset_flags_yy[k0:k1, :] = flags[1, :n]
+                dset_time_blk[k0:k1] = t_blk
+
+                # Progress: tqdm, or occasional text messages
+                if pbar is not None:
+                    pbar.update(n)
+                elif k1 // 100 > done // 100 or k1 == T:
+                    print(f"[INFO] Processed block {k1}/{T}")
+                done = k1
+
+        if pbar is not None:
+            pbar.close()
+
+        print(f"[INFO] Finished streaming SK computation for {T} blocks.")
+
+    print(f"[INFO] Output written to: {out_path}")
 
-    # File-level metadata
-    fout.attrs["input_file"] = os.path.abspath(h5_path)
-    fout.attrs["M"] = int(M)
-    fout.attrs["N"] = int(N)
-    fout.attrs["d"] = float(d)
-    fout.attrs["pfa"] = float(pfa)
-    fout.attrs["ns_total"] = int(ns_total)
-    fout.attrs["ns_start"] = int(start_idx)
-    fout.attrs["ns_eff"] = int(ns_eff)
-    fout.attrs["nfreq"] = int(nf)
-    fout.attrs["description"] = (
-        "Streaming SK spectrometer product: s1_xx(t,f), s1_yy(t,f), "
-        "and SK flags for XX and YY (sk_flags_xx, sk_flags_yy) computed "
-        "from non-overlapping blocks of M spectra. "
-        "time_blk is the block-center time derived from the original time array."
-    )
 
-    print("[INFO] Starting streaming SK computation (XX and YY, flags for both)...")
+# ----------------------------------------------------------------------
+# Programmatic entry point
+# ----------------------------------------------------------------------
+def resolve_paths(h5file: str, out: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Return (h5_path, out_path) as the CLI resolves them.
+
+    The input may be given without its .h5/.hdf5 extension. The output is:
+      - out is None            -> ./<basename>_skstream.h5
+      - out is an existing dir -> <out>/<basename>_skstream.h5
+      - else                   -> out, taken as a file path
+    """
+    h5_path = h5file
+    if not os.path.exists(h5_path):
+        candidates = [f"{h5_path}.h5", f"{h5_path}.hdf5"]
+        existing = [c for c in candidates if os.path.exists(c)]
+        if not existing:
+            raise FileNotFoundError(
+                f"Could not find HDF5 file at '{h5file}' or any of {candidates}"
+            )
+        h5_path = existing[0]
 
-    # Choose iterator with or without tqdm
-    if tqdm is not None:
-        iterator = tqdm(range(T), desc="SK blocks", unit="block")
+    base = os.path.splitext(os.path.basename(h5_path))[0]
+    if out is None:
+        out_path = f"{base}_skstream.h5"
+    elif os.path.isdir(out):
+        out_path = os.path.join(out, f"{base}_skstream.h5")
     else:
-        iterator = range(T)
-
-    # Iterate over blocks
-    for k in iterator:
-        i0 = start_idx + k * M
-        i1 = i0 + M
-
-        # Read blocks (M, nf) for XX and YY as float64 for numerics
-        block_xx = np.asarray(ds_xx[i0:i1, :], dtype=np.float64)
-        block_yy = np.asarray(ds_yy[i0:i1, :], dtype=np.float64)
-
-        # Time block (we take its mean as block center)
-        t_block = time[i0:i1]
-        time_blk_k = float(np.mean(t_block))
-        dset_time_blk[k] = time_blk_k
-
-        # S1 for both pols
-        s1_xx_block = block_xx.sum(axis=0, dtype=np.float64)  # (nf,)
-        s1_yy_block = block_yy.sum(axis=0, dtype=np.float64)  # (nf,)
-
-        # S2 for both pols
-        s2_xx_block = np.square(block_xx, dtype=np.float64).sum(axis=0)  # (nf,)
-        s2_yy_block = np.square(block_yy, dtype=np.float64).sum(axis=0)  # (nf,)
-
-        # Compute SK for XX and YY; core.get_sk expects 2-D input
-        sk_xx_block = core.get_sk(
-            s1_xx_block[None, :],
-            s2_xx_block[None, :],
-            M=M,
-            N=N,
-            d=d,
-        )[0, :]  # (nf,)
-
-        sk_yy_block = core.get_sk(
-            s1_yy_block[None, :],
-            s2_yy_block[None, :],
-            M=M,
-            N=N,
-            d=d,
-        )[0, :]  # (nf,)
-
-        # Flags from SK for both pols
-        flags_xx = np.zeros_like(sk_xx_block, dtype=np.int8)
-        flags_yy = np.zeros_like(sk_yy_block, dtype=np.int8)
-
-        flags_xx[sk_xx_block < lower] = -1
-        flags_xx[sk_xx_block > upper] = +1
-
-        flags_yy[sk_yy_block < lower] = -1
-        flags_yy[sk_yy_block > upper] = +1
-
-        # Store results (S1 as float32, flags as int8)
-        dset_s1_xx[k, :] = s1_xx_block.astype("float32")
-        dset_s1_yy[k, :] = s1_yy_block.astype("float32")
-        dset_flags_xx[k, :] = flags_xx
-        dset_flags_yy[k, :] = flags_yy
-
-        # If tqdm is not available, print occasional progress
-        if tqdm is None:
-            if (k + 1) % 100 == 0 or (k + 1) == T:
-                print(f"[INFO] Processed block {k+1}/{T}")
-
-    print(f"[INFO] Finished streaming SK computation for {T} blocks.")
-
-    fout.close()
-    fin.close()
+        out_path = out
+    return h5_path, out_path
 
-    print(f"[INFO] Output written to: {out_path}")
+
+def run(
+    h5file: str,
+    *,
+    out: Optional[str] = None,
+    M: int = 64,
+    N: int = 24,
+    d: float = 1.0,
+    pfa: float = 1e-3,
+    start_idx: int = 0,
+    ns_max: Optional[int] = None,
+    compression: Optional[str] = "lzf",
+    workers: int = 1,
+) -> str:
+    """
+    Resolve input/output paths exactly as the CLI does, run
+    stream_sk_dualpol, and return the path of the written SK-stream file.
+
+    This lets batch drivers call the stage in-process instead of paying
+    interpreter start-up and re-imports for every file.
+    """
+    h5_path, out_path = resolve_paths(h5file, out)
+    if h5_path != h5file:
+        print(f"[INFO] Input file not found exactly, using candidate: {h5_path}")
+
+    stream_sk_dualpol(
+        h5_path=h5_path,
+        out_path=out_path,
+        M=M,
+        N=N,
+        d=d,
+        pfa=pfa,
+        start_idx=start_idx,
+        ns_max=ns_max,
+        compression=compression,
+        workers=workers,
+    )
+    return out_path
 
 
 # ----------------------------------------------------------------------
@@ -411,10 +943,13 @@ def main() -> None:
     )
 
     ap.add_argument(
-        "h5file",
+        "h5files",
+        metavar="h5file",
         type=str,
-        help="Input OVRO-LWA HDF5 file (single tuning). "
-             "You can omit the .h5/.hdf5 extension; common suffixes are tried."
+        nargs="+",
+        help="Input OVRO-LWA HDF5 file(s) (single tuning). "
+             "You can omit the .h5/.hdf5 extension; common suffixes are tried. "
+             "Several files are processed one after the other in this process."
     )
     ap.add_argument(
         "-o", "--out",
@@ -424,7 +959,7 @@ def main() -> None:
             "Output HDF5 file. "
             "If omitted, defaults to <basename>_skstream.h5 in the current directory. "
             "If this is an existing directory, the default filename is placed inside "
-            "that directory."
+            "that directory (required form when several inputs are given)."
         ),
     )
 
@@ -442,57 +977,44 @@ def main() -> None:
     ap.add_argument("--ns-max", type=int, default=None,
                     help="Optional maximum number of time samples to process (default: all).")
 
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Worker processes summing S1/S2 within a file (default: 1).")
+
+    ap.add_argument(
+        "--compression",
+        choices=["lzf", "gzip", "none"],
+        default="lzf",
+        help="HDF5 compression for s1_xx/s1_yy/sk_flags_* datasets (default: lzf).",
+    )
     ap.add_argument(
         "--no-compression",
         action="store_true",
-        help="Disable HDF5 compression for s1_xx/s1_yy/sk_flags_* datasets.",
+        help="Disable HDF5 compression (same as --compression none).",
     )
 
     args = ap.parse_args()
 
-    # Resolve input HDF5 path (allow bare basename without extension)
-    h5_path = args.h5file
-    if not os.path.exists(h5_path):
-        candidates = [f"{h5_path}.h5", f"{h5_path}.hdf5"]
-        existing = [c for c in candidates if os.path.exists(c)]
-        if existing:
-            h5_path = existing[0]
-            print(f"[INFO] Input file not found exactly, using candidate: {h5_path}")
-        else:
-            raise FileNotFoundError(
-                f"Could not find HDF5 file at '{args.h5file}' or any of {candidates}"
-            )
-
-    base = os.path.splitext(os.path.basename(h5_path))[0]
-
-    # Resolve output path:
-    #   - if out is None            -> ./<basename>_skstream.h5
-    #   - if out is an existing dir -> <out>/<basename>_skstream.h5
-    #   - else                      -> treat out as a file path
-    if args.out is None:
-        out_path = f"{base}_skstream.h5"
-    else:
-        out_candidate = args.out
-        if os.path.isdir(out_candidate):
-            out_path = os.path.join(out_candidate, f"{base}_skstream.h5")
-        else:
-            out_path = out_candidate
-
-    compression = None if args.no_compression else "gzip"
-
-    stream_sk_dualpol(
-        h5_path=h5_path,
-        out_path=out_path,
-        M=args.M,
-        N=args.N,
-        d=args.d,
-        pfa=args.pfa,
-        start_idx=args.start_idx,
-        ns_max=args.ns_max,
-        compression=compression,
+    if len(args.h5files) > 1 and args.out is not None and not os.path.isdir(args.out):
+        ap.error("--out must be an existing directory when several inputs are given.")
+
+    compression = None if args.no_compression or args.compression == "none" else args.compression
+
+    batch_common.run_each_input(
+        args.h5files,
+        functools.partial(
+            run,
+            out=args.out,
+            M=args.M,
+            N=args.N,
+            d=args.d,
+            pfa=args.pfa,
+            start_idx=args.start_idx,
+            ns_max=args.ns_max,
+            compression=compression,
+            workers=args.workers,
+        ),
     )
 
 
-
 if __name__ == "__main__":
     main()